@@ -0,0 +1,327 @@
+"""Reproducible benchmarks for the MetaClean cleaning paths.
+
+    python benchmarks/bench.py generate CORPUS_DIR
+    python benchmarks/bench.py run CORPUS_DIR -o results.json
+    python benchmarks/bench.py compare baseline.json results.json
+
+generate builds a deterministic corpus: seeded-noise images saved with Pillow
+(with EXIF, XMP, comments or text chunks) and ffmpeg lavfi test sources
+with format tags, stream tags and chapters, each in several sizes. MP4 and
+MOV also get chapter-free copies, which the in-place editor can clean.
+
+run cleans fresh copies of every corpus file, one format per spawned
+process so peak RSS is attributable, and records wall time, files/s, MB/s,
+peak RSS and bytes written for each cleaner path. Videos are grouped by
+the engine that cleans them, e.g. "mp4/in_place" and "mp4/ffmpeg".
+
+compare prints the relative change between two result files and exits
+non-zero if any path got slower than the threshold.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SEED = 20240408
+
+IMAGE_SIZES = {"small": (320, 240), "medium": (1600, 1200), "large": (4000, 3000)}
+VIDEO_DURATIONS = {"small": 2, "medium": 10, "large": 60}
+
+IMAGE_FORMATS = {"jpg": "JPEG", "png": "PNG", "gif": "GIF", "bmp": "BMP", "tiff": "TIFF", "webp": "WEBP"}
+VIDEO_FORMATS = {
+    "mp4": ["-c:v", "mpeg4", "-c:a", "aac"],
+    "mov": ["-c:v", "mpeg4", "-c:a", "aac"],
+    "mkv": ["-c:v", "mpeg4", "-c:a", "aac"],
+    "avi": ["-c:v", "mpeg4", "-c:a", "mp3"],
+    "flv": ["-c:v", "flv1", "-c:a", "mp3", "-ar", "44100"],
+    "webm": ["-c:v", "libvpx", "-deadline", "realtime", "-c:a", "libopus"],
+}
+
+# Chapters make isobmff fall back to a remux, so without chapter-free
+# copies the in-place path would never be measured for these
+CHAPTER_FREE_FORMATS = ("mp4", "mov")
+
+XMP_PACKET = (b'<x:xmpmeta xmlns:x="adobe:ns:meta/"><rdf:RDF xmlns:rdf='
+              b'"http://www.w3.org/1999/02/22-rdf-syntax-ns#"><rdf:Description '
+              b'xmlns:xmp="http://ns.adobe.com/xap/1.0/" xmp:CreatorTool="bench"/>'
+              b'</rdf:RDF></x:xmpmeta>')
+
+FFMETADATA = """;FFMETADATA1
+title=MetaClean benchmark
+artist=bench
+comment=synthetic corpus
+[CHAPTER]
+TIMEBASE=1/1000
+START=0
+END=1000
+title=Opening
+[CHAPTER]
+TIMEBASE=1/1000
+START=1000
+END=2000
+title=Middle
+"""
+
+
+def generate_images(corpus, rng):
+    from PIL import Image, PngImagePlugin
+
+    for size_name, (width, height) in IMAGE_SIZES.items():
+        pixels = rng.randbytes(width * height * 3)
+        img = Image.frombytes("RGB", (width, height), pixels)
+        exif = Image.Exif()
+        exif[0x010F] = "BenchCam"  # Make
+        exif[0x0110] = "Model 1"  # Model
+        exif[0x0132] = "2024:04:08 13:00:35"  # DateTime
+
+        for ext, format_name in IMAGE_FORMATS.items():
+            path = os.path.join(corpus, f"{size_name}.{ext}")
+            if format_name == "JPEG":
+                img.save(path, format_name, quality=90, exif=exif, comment=b"bench", xmp=XMP_PACKET)
+            elif format_name == "PNG":
+                info = PngImagePlugin.PngInfo()
+                info.add_text("Author", "bench")
+                info.add_itxt("XML:com.adobe.xmp", XMP_PACKET.decode(), zip=True)
+                img.save(path, format_name, pnginfo=info, exif=exif)
+            elif format_name == "GIF":
+                img.convert("P").save(path, format_name, comment=b"bench")
+            elif format_name in ("TIFF", "WEBP"):
+                img.save(path, format_name, exif=exif)
+            else:
+                img.save(path, format_name)
+
+
+def generate_videos(corpus):
+    metadata_file = os.path.join(corpus, "ffmetadata.txt")
+    with open(metadata_file, "w") as f:
+        f.write(FFMETADATA)
+
+    for size_name, duration in VIDEO_DURATIONS.items():
+        for ext, codec_args in VIDEO_FORMATS.items():
+            variants = {f"{size_name}.{ext}": "2"}
+            if ext in CHAPTER_FREE_FORMATS:
+                variants[f"{size_name}-nochapters.{ext}"] = "-1"
+            for name, chapters in variants.items():
+                subprocess.run(
+                    ["ffmpeg", "-v", "error", "-y",
+                     "-f", "lavfi", "-i", f"testsrc2=duration={duration}:size=1280x720:rate=30",
+                     "-f", "lavfi", "-i", f"sine=frequency=440:duration={duration}",
+                     "-i", metadata_file,
+                     "-map", "0:v", "-map", "1:a", "-map_metadata", "2", "-map_chapters", chapters,
+                     "-metadata:s:v:0", "title=bench video", "-metadata:s:a:0", "title=bench audio",
+                     "-fflags", "+bitexact", "-flags:v", "+bitexact", "-flags:a", "+bitexact",
+                     *codec_args, os.path.join(corpus, name)],
+                    check=True,
+                )
+    os.remove(metadata_file)
+
+
+def generate(corpus):
+    os.makedirs(corpus, exist_ok=True)
+    generate_images(corpus, random.Random(SEED))
+    generate_videos(corpus)
+
+
+def _io_written():
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _peak_rss_bytes(who):
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def measure(files, repeat):
+    """Clean fresh copies of files repeat times; runs in its own process."""
+    import resource
+
+    from metaclean_core import clean_file
+
+    input_bytes = sum(os.path.getsize(f) for f in files)
+    timings = []
+    written = 0
+    with tempfile.TemporaryDirectory() as work:
+        for _ in range(repeat):
+            copies = []
+            for file in files:
+                copy = os.path.join(work, os.path.basename(file))
+                shutil.copyfile(file, copy)
+                copies.append(copy)
+
+            before = _io_written()
+            start = time.perf_counter()
+            for copy in copies:
+                clean_file(copy, force=True)
+            timings.append(time.perf_counter() - start)
+            after = _io_written()
+            if before is not None and after is not None:
+                written += after - before
+
+    best = min(timings)
+    return {
+        "files": len(files),
+        "input_bytes": input_bytes,
+        "wall_s": best,
+        "wall_s_all": timings,
+        "files_per_s": len(files) / best if best else None,
+        "mb_per_s": input_bytes / 1e6 / best if best else None,
+        "peak_rss_bytes": _peak_rss_bytes(resource.RUSAGE_SELF),
+        "child_peak_rss_bytes": _peak_rss_bytes(resource.RUSAGE_CHILDREN),
+        "bytes_written": written // repeat if _io_written() is not None else None,
+    }
+
+
+def engines(files):
+    """Return {file: "in_place" or "ffmpeg"}, the engine that cleans each video.
+
+    Runs in its own process: every file is cleaned once with instrumentation
+    on, and counts as "ffmpeg" if an ffmpeg span ran for it.
+    """
+    from metaclean_core import clean_file, instrument
+
+    copies = {}
+    with tempfile.TemporaryDirectory() as work:
+        instrument.start()
+        try:
+            for file in files:
+                copy = os.path.join(work, os.path.basename(file))
+                shutil.copyfile(file, copy)
+                copies[copy] = file
+                clean_file(copy, force=True)
+        finally:
+            events = instrument.finish()
+    remuxed = {event["args"]["file"] for event in events
+               if event["type"] == "span" and event["name"] == "ffmpeg"}
+    return {file: "ffmpeg" if copy in remuxed else "in_place" for copy, file in copies.items()}
+
+
+def environment():
+    try:
+        ffmpeg_version = subprocess.run(["ffmpeg", "-version"], capture_output=True,
+                                        text=True).stdout.splitlines()[0]
+    except (OSError, IndexError):
+        ffmpeg_version = None
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "ffmpeg": ffmpeg_version,
+        "commit": commit,
+    }
+
+
+def run(corpus, repeat, only=None):
+    from metaclean_core.formats import VIDEO_EXTENSIONS
+
+    by_format = {}
+    for name in sorted(os.listdir(corpus)):
+        ext = os.path.splitext(name)[1].lower().lstrip(".")
+        if ext and (not only or ext in only):
+            by_format.setdefault(ext, []).append(os.path.join(corpus, name))
+
+    context = multiprocessing.get_context("spawn")
+    by_path = {}
+    for ext, files in by_format.items():
+        if "." + ext not in VIDEO_EXTENSIONS:
+            by_path[ext] = files
+            continue
+        with ProcessPoolExecutor(1, mp_context=context) as pool:
+            found = pool.submit(engines, files).result()
+        for file in files:
+            by_path.setdefault(f"{ext}/{found[file]}", []).append(file)
+
+    results = {}
+    for path, files in by_path.items():
+        # A fresh process per path keeps peak RSS from bleeding between formats
+        with ProcessPoolExecutor(1, mp_context=context) as pool:
+            results[path] = pool.submit(measure, files, repeat).result()
+        r = results[path]
+        print(f"{path:13} {r['files']:3} files  {r['wall_s']:8.3f} s  {r['mb_per_s']:9.1f} MB/s  "
+              f"{r['files_per_s']:8.1f} files/s", file=sys.stderr)
+    return {"environment": environment(), "repeat": repeat, "results": results}
+
+
+def compare(baseline_path, current_path, threshold):
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+    with open(current_path) as f:
+        current = json.load(f)["results"]
+
+    regressed = False
+    for path in sorted(set(baseline) & set(current)):
+        old, new = baseline[path]["wall_s"], current[path]["wall_s"]
+        change = (new - old) / old if old else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressed = True
+        print(f"{path:13} {old:8.3f} s -> {new:8.3f} s  {change:+7.1%}{flag}")
+    return 1 if regressed else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="MetaClean benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("generate", help="build the synthetic corpus")
+    p.add_argument("corpus")
+
+    p = sub.add_parser("run", help="benchmark every cleaner path on a corpus")
+    p.add_argument("corpus")
+    p.add_argument("-o", "--output", help="write JSON results here (default: stdout)")
+    p.add_argument("-r", "--repeat", type=int, default=3, help="runs per path, best is reported")
+    p.add_argument("--only", nargs="+", metavar="EXT", help="limit to these extensions")
+
+    p = sub.add_parser("compare", help="compare two result files")
+    p.add_argument("baseline")
+    p.add_argument("current")
+    p.add_argument("--threshold", type=float, default=0.10,
+                   help="relative slowdown that counts as a regression (default: %(default)s)")
+
+    args = parser.parse_args(argv)
+    if args.command == "generate":
+        generate(args.corpus)
+        return 0
+    if args.command == "compare":
+        return compare(args.baseline, args.current, args.threshold)
+
+    results = run(args.corpus, args.repeat, args.only)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+"""Import-time regression check for the headless code paths.
+
+    python benchmarks/importtime.py
+    python benchmarks/importtime.py --repeat 10 --scale 1.5
+
+Imports each headless entry point in a fresh interpreter under
+``python -X importtime`` and fails if its cumulative import time (best of
+--repeat runs) exceeds its budget, or if it pulled in a library that only
+some files or the GUI need.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Loaded on demand by the cleaners that need them, never at startup
+HEAVY = ("tkinter", "PIL", "ffmpeg", "asyncio", "multiprocessing", "ctypes")
+
+# module -> budget in milliseconds, about twice a typical cold measurement so
+# only a real regression (a new eager import) trips it
+BUDGETS_MS = {
+    "metaclean_core": 10,
+    "metaclean_core.cleaner": 50,
+    "metaclean_core.cli": 100,
+}
+
+
+def importtime(module):
+    """Return ({module: cumulative microseconds}) for one fresh import."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True, cwd=ROOT, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def script_imports():
+    """Modules loaded by ``metaclean.py --help``, the headless script entry."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "metaclean.py", "--help"],
+                            capture_output=True, text=True, cwd=ROOT, check=True)
+    return {line.split("|")[-1].strip() for line in result.stderr.splitlines()
+            if line.startswith("import time:")}
+
+
+def heavy_modules(modules):
+    return sorted({m.split(".")[0] for m in modules} & set(HEAVY))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="MetaClean import-time budget check")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per module, best is used")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="multiply every budget, for slow CI machines")
+    args = parser.parse_args(argv)
+
+    failed = False
+    for module, budget in BUDGETS_MS.items():
+        runs = [importtime(module) for _ in range(args.repeat)]
+        best = min(run[module] for run in runs) / 1000
+        limit = budget * args.scale
+        heavy = heavy_modules(runs[0])
+        status = "ok"
+        if best > limit or heavy:
+            status = "FAIL"
+            failed = True
+        print(f"{module:24} {best:7.1f} ms  (budget {limit:.0f} ms)  {status}")
+        if heavy:
+            print(f"    imports {', '.join(heavy)}")
+
+    heavy = heavy_modules(script_imports())
+    print(f"{'metaclean.py --help':24} {'FAIL' if heavy else 'ok'}")
+    if heavy:
+        print(f"    imports {', '.join(heavy)}")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,35 @@
+import sys
+
+if __name__ == "__main__" and len(sys.argv) > 1:
+    # Any arguments mean headless mode, same as python -m metaclean_core.
+    # Dispatched before the GUI imports so hook scripts never load Tk
+    from metaclean_core.cli import main
+    sys.exit(main())
+
 import os
-import ffmpeg
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import threading
 import platform
 import subprocess
-from PIL import Image, ImageTk
-import time
+import sqlite3
+import queue
+import itertools
+from metaclean_core.batch import BatchEngine
+from metaclean_core.discovery import discover_sized
+from metaclean_core.formats import (SUPPORTED_EXTENSIONS, VIDEO_EXTENSIONS, IMAGE_EXTENSIONS, ARCHIVE_EXTENSIONS,
+                                    ARCHIVE_FORMATS, detect)
+from metaclean_core.index import CleanIndex
+from metaclean_core.journal import Journal, pending_files
+from metaclean_core.progress import format_progress
+
+CONSOLE_MAX_LINES = 1000
+LOG_DRAIN_INTERVAL_MS = 100
 
 class MetadataCleanerApp:
-    def __init__(self, root):
+    def __init__(self, root, log_path=None):
         self.root = root
+        self.log_file = open(log_path, "a", encoding="utf-8") if log_path else None
         self.root.title("MetaClean")
         self.root.geometry("800x600")  # Smaller window size
         self.root.config(bg="#121212")  # Modern dark theme
@@ -32,8 +51,8 @@ class MetadataCleanerApp:
             "description": """MetaClean is a powerful metadata removal tool designed for privacy-conscious users: 
             Completely stripping hidden metadata deigned to fingerprint/track you and your files, ensuring original quality preservation.""",
             "supported_formats": {
-                "Video": [".mp4", ".mkv", ".avi", ".mov", ".flv", ".webm"],
-                "Images": [".png", ".jpg", ".jpeg", ".gif", ".bmp", ".tiff"]
+                "Video": list(VIDEO_EXTENSIONS),
+                "Images": list(IMAGE_EXTENSIONS)
             }
         }
 
@@ -44,6 +63,10 @@ class MetadataCleanerApp:
         self.main_container = tk.Frame(root, bg=self.bg_color)
         self.main_container.pack(fill=tk.BOTH, expand=True, padx=30, pady=25)
 
+        # Read by drain_log, which setup_console schedules
+        self.processing = False
+        self.latest_progress = None
+
         # Setup UI components in correct order
         self.setup_status_bar()  # Move this first
         self.setup_title_section()
@@ -53,8 +76,38 @@ class MetadataCleanerApp:
 
         # Variables
         self.selected_files = []
-        self.processing = False
+        self.selected_sizes = {}  # Sizes found while scanning a folder, used to schedule the batch
         self.about_window = None
+        self.engine = BatchEngine()  # One worker per core
+        self.resuming = False
+        self.check_interrupted_batch()
+
+    def open_index(self):
+        # Remembers cleaned files so unchanged ones are skipped on the next run;
+        # opt-in, like the command line's --index
+        if not self.use_index.get():
+            return None
+        try:
+            return CleanIndex()
+        except (OSError, sqlite3.Error):
+            return None
+
+    def open_journal(self, resume):
+        # Records each file's progress so a killed batch can be resumed
+        try:
+            return Journal(resume=resume)
+        except OSError:
+            return None
+
+    def check_interrupted_batch(self):
+        pending = pending_files()
+        if pending:
+            self.selected_files = pending
+            self.resuming = True
+            self.start_button.config(state=tk.NORMAL)
+            self.status_label.config(text=f"Interrupted batch: {len(pending)} files left")
+            self.log_to_console(f"The last batch was interrupted with {len(pending)} files left. "
+                                "Click CLEAN to resume it.")
 
     def setup_styles(self):
         style = ttk.Style()
@@ -242,7 +295,52 @@ class MetadataCleanerApp:
             command=self.start_cleaning,
             state=tk.DISABLED
         )
-        self.start_button.pack(fill=tk.X, ipady=2)
+        self.start_button.pack(side=tk.LEFT, fill=tk.X, expand=True, ipady=2, padx=(0, 5))
+
+        # Stop button - aborts a running batch, killing any ffmpeg processes
+        self.stop_button = ttk.Button(
+            clean_frame,
+            text="STOP",
+            style="Custom.TButton",
+            command=self.stop_cleaning,
+            state=tk.DISABLED
+        )
+        self.stop_button.pack(side=tk.RIGHT, ipady=2, padx=(5, 0))
+
+        # Off by default: the index records every cleaned path in the user's cache folder
+        self.use_index = tk.BooleanVar(value=False)
+        self.index_checkbox = tk.Checkbutton(
+            self.buttons_frame,
+            text="Skip files cleaned on a previous run",
+            variable=self.use_index,
+            bg=self.bg_color,
+            fg=self.fg_color,
+            selectcolor=self.button_bg,
+            activebackground=self.bg_color,
+            activeforeground=self.fg_color,
+            highlightthickness=0
+        )
+        self.index_checkbox.pack(anchor=tk.W, pady=(10, 0))
+
+        # Off by default: archives with media in them are rewritten as a whole
+        self.use_archives = tk.BooleanVar(value=False)
+        self.archives_checkbox = tk.Checkbutton(
+            self.buttons_frame,
+            text="Also clean media inside archives (.zip, .tar, .tar.gz, .tar.xz)",
+            variable=self.use_archives,
+            bg=self.bg_color,
+            fg=self.fg_color,
+            selectcolor=self.button_bg,
+            activebackground=self.bg_color,
+            activeforeground=self.fg_color,
+            highlightthickness=0
+        )
+        self.archives_checkbox.pack(anchor=tk.W)
+
+    def selectable_extensions(self):
+        if self.use_archives.get():
+            return SUPPORTED_EXTENSIONS + ARCHIVE_EXTENSIONS
+        return SUPPORTED_EXTENSIONS
 
     def setup_progress_bar(self):
         self.progress_frame = tk.Frame(self.buttons_frame, bg=self.bg_color)
@@ -272,6 +370,13 @@ class MetadataCleanerApp:
         self.console_text.pack(fill=tk.BOTH, expand=True, padx=25, pady=8)
         self.console_visible = False
 
+        # One tag per severity, configured once
+        self.console_text.tag_configure("success", foreground=self.success_color)
+        self.console_text.tag_configure("error", foreground=self.error_color)
+        self.log_tags = {self.success_color: "success", self.error_color: "error"}
+        self.log_queue = queue.Queue()
+        self.root.after(LOG_DRAIN_INTERVAL_MS, self.drain_log)
+
     def setup_status_bar(self):
         self.status_frame = tk.Frame(self.main_container, bg=self.bg_color)
         self.status_frame.pack(fill=tk.X, side=tk.BOTTOM, pady=(30, 10))
@@ -309,14 +414,22 @@ class MetadataCleanerApp:
 
     def select_file(self):
         filetypes = [
-            ("All Supported Files", "*.mp4 *.mkv *.avi *.mov *.flv *.webm *.png *.jpg *.jpeg *.gif *.bmp *.tiff"),
-            ("Video Files", "*.mp4 *.mkv *.avi *.mov *.flv *.webm"),
-            ("Image Files", "*.png *.jpg *.jpeg *.gif *.bmp *.tiff"),
-            ("All Files", "*.*")
+            ("All Supported Files", " ".join(f"*{ext}" for ext in self.selectable_extensions())),
+            ("Video Files", " ".join(f"*{ext}" for ext in VIDEO_EXTENSIONS)),
+            ("Image Files", " ".join(f"*{ext}" for ext in IMAGE_EXTENSIONS)),
         ]
+        if self.use_archives.get():
+            filetypes.append(("Archives", " ".join(f"*{ext}" for ext in ARCHIVE_EXTENSIONS)))
+        filetypes.append(("All Files", "*.*"))
         file = filedialog.askopenfilename(filetypes=filetypes)
+        if file and detect(file) in ARCHIVE_FORMATS and not self.use_archives.get():
+            self.log_to_console(f"{os.path.basename(file)} is an archive; tick "
+                                "\"Also clean media inside archives\" to clean it", color=self.error_color)
+            return
         if file:
             self.selected_files = [file]
+            self.selected_sizes = {}
+            self.resuming = False
             self.status_label.config(text=f"Selected: {os.path.basename(file)}")
             self.start_button.config(state=tk.NORMAL)
             self.log_to_console(f"File selected: {file}")
@@ -324,14 +437,11 @@ class MetadataCleanerApp:
     def select_folder(self):
         folder = filedialog.askdirectory()
         if folder:
-            self.selected_files = []
-            valid_extensions = ('.mp4', '.mkv', '.avi', '.mov', '.flv', '.webm',
-                              '.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff')
-            
-            for root, _, files in os.walk(folder):
-                for file in files:
-                    if file.lower().endswith(valid_extensions):
-                        self.selected_files.append(os.path.join(root, file))
+            # Media inside archives is cleaned entry by entry, without extracting
+            self.selected_sizes = dict(discover_sized(folder, recursive=True,
+                                                      extensions=self.selectable_extensions()))
+            self.selected_files = list(self.selected_sizes)
+            self.resuming = False
             
             if self.selected_files:
                 self.status_label.config(text=f"Selected folder: {os.path.basename(folder)}")
@@ -352,129 +462,122 @@ class MetadataCleanerApp:
             self.start_button.config(state=tk.DISABLED)
             self.select_file_button.config(state=tk.DISABLED)
             self.select_folder_button.config(state=tk.DISABLED)
+            self.index_checkbox.config(state=tk.DISABLED)
+            self.archives_checkbox.config(state=tk.DISABLED)
+            self.stop_button.config(state=tk.NORMAL)
             self.status_label.config(text="Status: Cleaning in progress...")
-            
+            self.progress_bar.pack(fill=tk.X, pady=(0, 10))
+            self.progress_bar["value"] = 0
+            self.latest_progress = None
+            # Read here: Tk variables belong to the main thread
+            self.engine.index = self.open_index()
+
             threading.Thread(target=self.clean_metadata, daemon=True).start()
 
-    def clean_file(self, file):
-        temp_file = f"{file}.temp"
-        try:
-            ext = os.path.splitext(file)[1].lower()
-            
-            if ext in ['.mp4', '.mkv', '.avi', '.mov', '.flv', '.webm']:
-                stream = ffmpeg.input(file)
-                output_args = {
-                    'map_metadata': -1,
-                    'map_chapters': -1,
-                    'fflags': '+bitexact',
-                    'acodec': 'copy',
-                    'vcodec': 'copy'
-                }
-                
-                     # Format-specific handling while keeping working formats unchanged
-                if ext == '.mkv':
-                    output_args['f'] = 'matroska'
-                elif ext == '.mp4':
-                    output_args['f'] = 'mp4'
-                    output_args['movflags'] = '+faststart'
-                elif ext == '.mov':
-                    output_args['f'] = 'mov'
-                    output_args['movflags'] = '+faststart'  # QuickTime needs faststart too
-                elif ext == '.avi':
-                    output_args['f'] = 'avi'
-                    output_args['fflags'] += '+genpts'  # Ensure proper timestamps
-                elif ext == '.flv':
-                    output_args['f'] = 'flv'
-                    output_args['flv_metadata'] = ''  # Clear FLV specific metadata
-                elif ext == '.webm':
-                    output_args['f'] = 'webm'
-                    output_args['metadata'] = ''  # Clear WebM metadata
-                
-                stream = ffmpeg.output(stream, temp_file, **output_args)
-                stream = stream.overwrite_output()
-                ffmpeg.run(stream, capture_stderr=True)
-            
-            elif ext in ['.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff']:
-                format_name = 'jpeg' if ext == '.jpg' else ext[1:]
-                
-                try:
-                    with Image.open(file) as img:
-                        cleaned_img = Image.new(img.mode, img.size)
-                        cleaned_img.putdata(list(img.getdata()))
-                        cleaned_img.save(temp_file, format=format_name)
-                except Exception:
-                    stream = ffmpeg.input(file)
-                    stream = ffmpeg.output(stream, temp_file,
-                                        map_metadata=-1,
-                                        fflags='+bitexact')
-                    stream = stream.overwrite_output()
-                    ffmpeg.run(stream, capture_stderr=True)
-
-            if not os.path.exists(temp_file) or os.path.getsize(temp_file) == 0:
-                raise Exception("Failed to create valid output file")
-            
-            os.replace(temp_file, file)
-            
-        except ffmpeg.Error as e:
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
-            error_message = e.stderr.decode() if e.stderr else 'Unknown FFmpeg error'
-            raise Exception(f"FFmpeg error: {error_message}")
-        except Exception as e:
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
-            raise Exception(f"Failed to clean metadata: {str(e)}")
+    def stop_cleaning(self):
+        if self.processing:
+            self.stop_button.config(state=tk.DISABLED)
+            self.log_to_console("Stopping, remaining files will be left untouched...")
+            self.engine.cancel()
 
     def clean_metadata(self):
         total_files = len(self.selected_files)
-        successful = 0
-        failed = 0
-
-        self.progress_bar.pack(fill=tk.X, pady=(0, 10))
-        self.progress_bar["value"] = 0
 
         self.log_to_console(f"Starting metadata cleaning for {total_files} files...")
         
-        for index, file in enumerate(self.selected_files):
-            try:
-                self.log_to_console(f"Processing: {os.path.basename(file)}")
-                
-                self.clean_file(file)
-                successful += 1
-                
-                progress = ((index + 1) / total_files) * 100
-                self.progress_bar["value"] = progress
-                
+        skipped = 0
+
+        def on_skip(file):
+            nonlocal skipped
+            skipped += 1
+
+        def on_start(file):
+            self.log_to_console(f"Processing: {os.path.basename(file)}")
+
+        def on_result(file, error):
+            if error is None:
                 success_msg = f"Successfully cleaned: {os.path.basename(file)}"
                 self.log_to_console(success_msg, color=self.success_color)
-                
-            except Exception as e:
-                failed += 1
-                self.log_to_console(f"Error processing {os.path.basename(file)}: {str(e)}", 
+            else:
+                self.log_to_console(f"Error processing {os.path.basename(file)}: {str(error)}", 
                                   color=self.error_color)
 
+        def on_progress(snapshot):
+            # Picked up by the main loop in drain_log
+            self.latest_progress = snapshot
+
+        journal = self.open_journal(self.resuming)
+        if journal and self.resuming:
+            # Removes partial outputs left next to interrupted files
+            self.selected_files = journal.prepare_resume()
+        self.engine.journal = journal
+        try:
+            successful, failed = self.engine.run(self.selected_files, on_start, on_result, on_skip, on_progress,
+                                                 sizes=self.selected_sizes)
+        finally:
+            self.engine.journal = None
+            self.resuming = False
+            if journal:
+                # Kept only while files are left to resume
+                journal.close(remove_finished=True)
+            if self.engine.index:
+                self.engine.index.close()
+                self.engine.index = None
+
         self.processing = False
         
         self.root.after(0, lambda: self.start_button.config(state=tk.NORMAL))
         self.root.after(0, lambda: self.select_file_button.config(state=tk.NORMAL))
         self.root.after(0, lambda: self.select_folder_button.config(state=tk.NORMAL))
+        self.root.after(0, lambda: self.index_checkbox.config(state=tk.NORMAL))
+        self.root.after(0, lambda: self.archives_checkbox.config(state=tk.NORMAL))
+        self.root.after(0, lambda: self.stop_button.config(state=tk.DISABLED))
 
         self.root.after(1000, self.progress_bar.pack_forget)
-        self.root.after(0, self.update_status_complete, successful, failed, total_files)
+        self.root.after(0, self.update_status_complete, successful, failed, total_files, skipped)
 
-    def update_status_complete(self, successful, failed, total):
+    def update_status_complete(self, successful, failed, total, skipped=0):
         status = f"Completed: {successful} succeeded, {failed} failed out of {total} files"
+        if skipped:
+            status += f" ({skipped} already clean)"
         self.status_label.config(text=status)
         self.log_to_console(status)
 
     def log_to_console(self, message, color=None):
-        self.console_text.config(state=tk.NORMAL)
-        tag = f"color_{time.time()}"
-        self.console_text.insert(tk.END, f"[*] {message}\n", tag)
-        if color:
-            self.console_text.tag_configure(tag, foreground=color)
-        self.console_text.see(tk.END)
-        self.console_text.config(state=tk.DISABLED)
+        # Safe from any thread, the Tk main loop does the actual drawing
+        tag = self.log_tags.get(color, "info")
+        self.log_queue.put((f"[*] {message}\n", tag))
+
+    def drain_log(self):
+        lines = []
+        try:
+            while True:
+                lines.append(self.log_queue.get_nowait())
+        except queue.Empty:
+            pass
+
+        if lines:
+            if self.log_file:
+                self.log_file.writelines(line for line, _ in lines)
+                self.log_file.flush()
+
+            # Anything older than the last CONSOLE_MAX_LINES would be trimmed anyway
+            lines = lines[-CONSOLE_MAX_LINES:]
+            self.console_text.config(state=tk.NORMAL)
+            for tag, group in itertools.groupby(lines, key=lambda item: item[1]):
+                self.console_text.insert(tk.END, "".join(line for line, _ in group), tag)
+            excess = int(self.console_text.index("end-1c").split(".")[0]) - 1 - CONSOLE_MAX_LINES
+            if excess > 0:
+                self.console_text.delete("1.0", f"{excess + 1}.0")
+            self.console_text.see(tk.END)
+            self.console_text.config(state=tk.DISABLED)
+
+        snapshot, self.latest_progress = self.latest_progress, None
+        if snapshot and self.processing:
+            self.progress_bar["value"] = snapshot["percent"]
+            self.status_label.config(text=f"Cleaning: {format_progress(snapshot)}")
+
+        self.root.after(LOG_DRAIN_INTERVAL_MS, self.drain_log)
 
     def toggle_console(self):
         if self.console_visible:
@@ -488,5 +591,6 @@ class MetadataCleanerApp:
 
 if __name__ == "__main__":
     root = tk.Tk()
-    app = MetadataCleanerApp(root)
+    # Set METACLEAN_LOG to keep the full log, the console only shows the tail
+    app = MetadataCleanerApp(root, log_path=os.environ.get("METACLEAN_LOG"))
     root.mainloop()
\ No newline at end of file
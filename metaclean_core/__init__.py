@@ -0,0 +1,58 @@
+"""GUI-free cleaning engines used by MetaClean.
+
+The names below are imported on first access, so ``import metaclean_core``
+is cheap and a run only loads the engines (and ffmpeg-python, Pillow or
+asyncio) that it actually uses.
+"""
+
+import importlib
+
+_EXPORTS = {
+    "strip_jpeg": ("jpeg", "strip_jpeg"),
+    "is_jpeg": ("jpeg", "is_jpeg"),
+    "strip_png": ("png", "strip_png"),
+    "is_png": ("png", "is_png"),
+    "strip_webp": ("webp", "strip_webp"),
+    "strip_gif": ("gif", "strip_gif"),
+    "strip_tiff": ("tiff", "strip_tiff"),
+    "clean_archive": ("archive", "clean_archive"),
+    "strip_heif_in_place": ("heif", "strip_in_place"),
+    "strip_isobmff_in_place": ("isobmff", "strip_in_place"),
+    "strip_matroska_in_place": ("ebml", "strip_in_place"),
+    "SUPPORTED_EXTENSIONS": ("formats", "SUPPORTED_EXTENSIONS"),
+    "VIDEO_EXTENSIONS": ("formats", "VIDEO_EXTENSIONS"),
+    "IMAGE_EXTENSIONS": ("formats", "IMAGE_EXTENSIONS"),
+    "ARCHIVE_EXTENSIONS": ("formats", "ARCHIVE_EXTENSIONS"),
+    "sniff": ("formats", "sniff"),
+    "clean_file": ("cleaner", "clean_file"),
+    "BatchEngine": ("batch", "BatchEngine"),
+    "VideoRunner": ("ffmpeg_async", "VideoRunner"),
+    "FFmpegTimeout": ("errors", "FFmpegTimeout"),
+    "discover": ("discovery", "discover"),
+    "discover_sized": ("discovery", "discover_sized"),
+    "Watcher": ("watch", "Watcher"),
+    "CleanIndex": ("index", "CleanIndex"),
+    "Journal": ("journal", "Journal"),
+    "Output": ("output", "Output"),
+    "probe_file": ("probe", "probe_file"),
+    "ProgressTracker": ("progress", "ProgressTracker"),
+    "UnsupportedStructure": ("errors", "UnsupportedStructure"),
+    "FFmpegError": ("errors", "FFmpegError"),
+    "VerificationError": ("errors", "VerificationError"),
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    try:
+        module, attr = _EXPORTS[name]
+    except KeyError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+    value = getattr(importlib.import_module(f".{module}", __name__), attr)
+    globals()[name] = value  # Later lookups skip __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
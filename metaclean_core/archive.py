@@ -0,0 +1,197 @@
+"""Cleaning the media inside ZIP and TAR archives without extracting them.
+
+Entries are read one at a time and written straight into a new archive.
+An entry with a supported extension is spilled to a temporary file,
+cleaned there by cleaner.clean_file (same engines, probe and verification
+as a loose file) and written back, then the spill is deleted; every other
+entry is copied through a fixed buffer. So memory use is one buffer and
+disk use one entry (plus its staged copy), however large the archive.
+ffmpeg runs for a video entry get the same size-scaled timeout as for a
+loose file (cleaner.timeout_for), so a stuck remux fails the archive
+instead of holding up the batch.
+
+TAR archives, plain or gzip/xz compressed, are read and written as streams
+and never seeked; the new archive uses the same compression, with no file
+name or time in the gzip header. Member headers are kept as they are. ZIP
+entries keep their name, date, permissions, comment and compression method,
+but not their extra fields (extended timestamps, owner ids). Nested
+archives are copied unchanged.
+"""
+
+import contextlib
+import os
+import shutil
+import tarfile
+import tempfile
+import zipfile
+
+from . import probe
+from .cleaner import clean_file
+from .discovery import is_supported
+from .formats import extension
+from .output import IN_PLACE, Output, create
+
+BUFFER_SIZE = 1 << 20
+GZIP_LEVEL = 6
+
+# Leading bytes -> compression of a TAR archive, as tarfile names it
+COMPRESSIONS = {b"\x1f\x8b": "gz", b"BZh": "bz2", b"\xfd7zXZ\x00": "xz"}
+
+
+def compression(path):
+    with open(path, "rb") as f:
+        head = f.read(6)
+    for magic, name in COMPRESSIONS.items():
+        if head.startswith(magic):
+            return name
+    return ""
+
+
+@contextlib.contextmanager
+def _compressor(f, name):
+    """Wrap the open file f in a streaming compressor (or none)."""
+    if name == "gz":
+        import gzip
+        stream = gzip.GzipFile(filename="", mode="wb", compresslevel=GZIP_LEVEL, fileobj=f, mtime=0)
+    elif name == "bz2":
+        import bz2
+        stream = bz2.BZ2File(f, "wb")
+    elif name == "xz":
+        import lzma
+        stream = lzma.LZMAFile(f, "wb")
+    else:
+        yield f
+        return
+    with stream:
+        yield stream
+
+
+def _tar_members(tar):
+    """Yield each member of a stream-mode TarFile, then forget it.
+
+    A TarFile keeps every member it has seen; dropping them keeps memory
+    flat for archives with millions of entries.
+    """
+    while True:
+        info = tar.next()
+        if info is None:
+            return
+        yield info
+        tar.members.clear()
+
+
+def _spill(name, src, folder, bufsize):
+    path = os.path.join(folder, "entry" + extension(name))
+    with open(path, "wb") as f:
+        shutil.copyfileobj(src, f, bufsize)
+    return path
+
+
+def _clean_entry(name, src, folder, output, bufsize):
+    """Spill one entry into folder and clean it; return (path, whether it changed)."""
+    path = _spill(name, src, folder, bufsize)
+    try:
+        return path, clean_file(path, output=output)
+    except Exception as e:
+        raise Exception(f"{name}: {e}") from e
+
+
+def _clean_tar(src_path, dst, folder, output, bufsize):
+    cleaned = 0
+    with tarfile.open(src_path, "r|*", bufsize=bufsize) as src, \
+            _compressor(dst, compression(src_path)) as stream, \
+            tarfile.open(fileobj=stream, mode="w|", format=tarfile.PAX_FORMAT, bufsize=bufsize) as out:
+        for info in _tar_members(src):
+            if not info.isfile():
+                out.addfile(info)
+            elif is_supported(info.name):
+                path, changed = _clean_entry(info.name, src.extractfile(info), folder, output, bufsize)
+                cleaned += changed
+                info.size = os.path.getsize(path)
+                info.pax_headers.pop("size", None)  # Would override the new size
+                with open(path, "rb") as f:
+                    out.addfile(info, f)
+                os.remove(path)
+            else:
+                out.addfile(info, src.extractfile(info))
+            out.members.clear()
+    return cleaned
+
+
+def _zip_info(info):
+    new = zipfile.ZipInfo(info.filename, info.date_time)
+    new.compress_type = info.compress_type
+    new.comment = info.comment
+    new.create_system = info.create_system
+    new.external_attr = info.external_attr
+    return new
+
+
+def _write_zip_entry(out, info, src, size, bufsize):
+    with out.open(info, "w", force_zip64=size >= zipfile.ZIP64_LIMIT) as dst:
+        shutil.copyfileobj(src, dst, bufsize)
+
+
+def _clean_zip(src_path, dst, folder, output, bufsize):
+    cleaned = 0
+    with zipfile.ZipFile(src_path) as src, zipfile.ZipFile(dst, "w") as out:
+        out.comment = src.comment
+        for info in src.infolist():
+            new = _zip_info(info)
+            if info.is_dir():
+                out.writestr(new, b"")
+                continue
+            with src.open(info) as entry:
+                if not is_supported(info.filename):
+                    _write_zip_entry(out, new, entry, info.file_size, bufsize)
+                    continue
+                path, changed = _clean_entry(info.filename, entry, folder, output, bufsize)
+            cleaned += changed
+            with open(path, "rb") as f:
+                _write_zip_entry(out, new, f, os.path.getsize(path), bufsize)
+            os.remove(path)
+    return cleaned
+
+
+def clean_archive(src_path, dst_path, kind, output=IN_PLACE, bufsize=BUFFER_SIZE):
+    """Write a copy of the archive src_path with its media cleaned to dst_path.
+
+    kind is "zip" or "tar". Entries are spilled to a temporary folder inside
+    output.staging_dir, if set, and verified when output.verify is set.
+    Returns the number of entries that were rewritten.
+    """
+    entry_output = Output(verify=output.verify)
+    with tempfile.TemporaryDirectory(prefix="metaclean-", dir=output.staging_dir) as folder, \
+            create(dst_path, os.path.getsize(src_path)) as dst:
+        if kind == "zip":
+            return _clean_zip(src_path, dst, folder, entry_output, bufsize)
+        return _clean_tar(src_path, dst, folder, entry_output, bufsize)
+
+
+def _media_entries(path, kind):
+    """Yield (name, open file) for each entry with a supported extension."""
+    if kind == "zip":
+        with zipfile.ZipFile(path) as src:
+            for info in src.infolist():
+                if not info.is_dir() and is_supported(info.filename):
+                    with src.open(info) as f:
+                        yield info.filename, f
+    else:
+        with tarfile.open(path, "r|*") as src:
+            for info in _tar_members(src):
+                if info.isfile() and is_supported(info.name):
+                    yield info.name, src.extractfile(info)
+
+
+def find_metadata(path, kind):
+    """Return the metadata clean_archive would remove, as "entry: finding"."""
+    found = []
+    with tempfile.TemporaryDirectory(prefix="metaclean-") as folder:
+        for name, src in _media_entries(path, kind):
+            spilled = _spill(name, src, folder, BUFFER_SIZE)
+            try:
+                findings = probe.probe_file(spilled)["findings"]
+            finally:
+                os.remove(spilled)
+            found.extend(f"{name}: {finding}" for finding in findings)
+    return found
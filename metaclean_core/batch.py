@@ -0,0 +1,228 @@
+"""Parallel batch cleaning.
+
+Image work (Pillow decode/encode and byte-level stripping) runs in a process
+pool so it is not serialised by the GIL. Video work is mostly waiting on an
+ffmpeg subprocess or on disk, so it runs as asyncio subprocesses on a single
+event loop (see ffmpeg_async), each with a timeout. Files are sized up
+front and started largest first in two lanes (see schedule): at most
+io_jobs disk-bound jobs (videos, archives, huge images) and queue_size
+CPU-bound ones are in flight at once, optionally paced to a bandwidth
+limit. cancel() stops a running batch.
+"""
+
+import contextlib
+import os
+import queue
+import threading
+from functools import partial
+
+from . import instrument
+from .cleaner import clean_file
+from .errors import Cancelled
+from .formats import is_video
+from .output import IN_PLACE
+from .progress import ProgressTracker
+from .schedule import CPU, IO, BandwidthLimit, Scheduler, size_jobs
+
+
+def _error(future):
+    if future.cancelled():
+        return Cancelled()
+    return future.exception()
+
+
+def default_jobs():
+    return os.cpu_count() or 1
+
+
+class BatchEngine:
+    def __init__(self, jobs=None, io_jobs=None, queue_size=None, index=None, ffmpeg_timeout=None,
+                 journal=None, output=None, bandwidth=None):
+        self.index = index  # Optional CleanIndex used to skip unchanged files
+        self.journal = journal  # Optional Journal recording progress for --resume
+        self.output = output or IN_PLACE  # Where cleaned files go, see output.Output
+        self.jobs = max(1, jobs or default_jobs())
+        # Remuxes are disk-bound, running more than a few at once just thrashes
+        self.io_jobs = max(1, io_jobs or min(4, self.jobs))
+        self.queue_size = max(1, queue_size or self.jobs * 4)
+        self.bandwidth = bandwidth  # Optional cap on bytes read per second, on average
+        self.ffmpeg_timeout = ffmpeg_timeout  # None scales the timeout with file size
+        self.cancelled = threading.Event()
+        self.futures = set()
+        self.futures_lock = threading.Lock()
+
+    def cancel(self):
+        """Stop submitting files and abort queued and running work.
+
+        Running ffmpeg processes are killed and their temp files removed;
+        image jobs already running in a worker process finish normally.
+        Safe to call from any thread.
+        """
+        self.cancelled.set()
+        with self.futures_lock:
+            futures = list(self.futures)
+        for future in futures:
+            future.cancel()
+
+    def _track(self, future):
+        with self.futures_lock:
+            self.futures.add(future)
+        future.add_done_callback(self._untrack)
+        return future
+
+    def _untrack(self, future):
+        with self.futures_lock:
+            self.futures.discard(future)
+
+    def run(self, files, on_start=None, on_result=None, on_skip=None, on_progress=None, sizes=None):
+        """Clean every file and return (successful, failed).
+
+        sizes ({file: bytes}, e.g. from discovery.discover_sized) saves a
+        stat of each file when the batch is scheduled.
+
+        on_start(file) is called when a file is submitted and
+        on_result(file, error) when it finishes, with error None on success.
+        Files the index already knows to be clean are passed to on_skip(file)
+        instead and not counted. These callbacks run in the thread that
+        called run().
+
+        on_progress(snapshot) receives ProgressTracker snapshots (bytes,
+        throughput, ETA). It is throttled and may be called from worker
+        threads while long remuxes are running.
+        """
+        self.cancelled.clear()
+        with instrument.span('batch.prepare'):
+            if self.index:
+                files = self._skip_clean(files, on_skip)
+            jobs = size_jobs(files, sizes)
+            if self.journal:
+                self.journal.queued([job.file for job in jobs])
+            tracker = ProgressTracker([job.file for job in jobs], on_progress,
+                                      sizes={job.file: job.size for job in jobs})
+        try:
+            with instrument.span('batch.clean', files=len(jobs), jobs=self.jobs):
+                if self.jobs == 1:
+                    return self._run_serial(jobs, on_start, on_result, tracker)
+                return self._run_parallel(jobs, on_start, on_result, tracker)
+        finally:
+            if self.index:
+                self.index.flush()
+            if self.journal:
+                self.journal.sync()
+
+    def _skip_clean(self, files, on_skip):
+        for file in files:
+            if self.index.is_clean(file):
+                if self.journal:
+                    self.journal.done(file)
+                if on_skip:
+                    on_skip(file)
+            else:
+                yield file
+
+    def _run_parallel(self, jobs, on_start, on_result, tracker):
+        counts = [0, 0]
+        results = queue.Queue()
+        scheduler = Scheduler(jobs, {IO: self.io_jobs, CPU: self.queue_size}, self.bandwidth)
+        # spawn keeps workers independent of the (possibly threaded, Tk-owning) parent
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(self.jobs, mp_context=context) as image_pool, \
+                self._video_runner(jobs, self.io_jobs) as video_runner:
+            while scheduler and not self.cancelled.is_set():
+                for job in scheduler.start():
+                    self._start(job.file, on_start)
+                    if is_video(job.file):
+                        # The event loop can report remux progress; worker processes cannot
+                        future = video_runner.submit(job.file, progress=partial(tracker.update, job.file))
+                    else:
+                        future = image_pool.submit(clean_file, job.file, output=self.output)
+                    self._track(future)
+                    future.add_done_callback(lambda f, job=job: results.put((job, f)))
+                try:
+                    # Wakes up early for the bandwidth limit, if one holds work back
+                    job, future = results.get(timeout=scheduler.delay())
+                except queue.Empty:
+                    continue
+                scheduler.finished(job)
+                self._handle(job.file, future, counts, on_result, tracker)
+
+            while scheduler.running_jobs():
+                job, future = results.get()
+                scheduler.finished(job)
+                self._handle(job.file, future, counts, on_result, tracker)
+
+        return counts[0], counts[1]
+
+    def _video_runner(self, jobs, concurrency):
+        # Image-only batches never load asyncio or start its event loop
+        if not any(is_video(job.file) for job in jobs):
+            return contextlib.nullcontext()
+        from .ffmpeg_async import VideoRunner
+        return VideoRunner(concurrency, self.ffmpeg_timeout, self.output)
+
+    def _handle(self, file, future, counts, on_result, tracker):
+        error = _error(future)
+        counts[0 if error is None else 1] += 1
+        self._record(file, error)
+        tracker.finish(file)
+        if on_result:
+            on_result(file, error)
+
+    def _start(self, file, on_start):
+        if self.journal:
+            self.journal.started(file)
+        if on_start:
+            on_start(file)
+
+    def _record(self, file, error):
+        if self.journal and not isinstance(error, Cancelled):
+            # Cancelled files stay "started" so a resumed run picks them up
+            if error is None:
+                self.journal.done(file)
+            else:
+                self.journal.failed(file, error)
+        if self.index and error is None:
+            try:
+                self.index.mark_clean(file)
+            except OSError:
+                pass  # Vanished after cleaning, it is just not indexed
+
+    def _run_serial(self, jobs, on_start, on_result, tracker):
+        successful = failed = 0
+        # One job at a time, in the given order; only the bandwidth limit applies
+        limit = BandwidthLimit(self.bandwidth) if self.bandwidth else None
+        with self._video_runner(jobs, 1) as video_runner:
+            for job in jobs:
+                if limit:
+                    self.cancelled.wait(limit.delay())
+                if self.cancelled.is_set():
+                    break
+                if limit:
+                    limit.take(job.size)
+                file = job.file
+                self._start(file, on_start)
+                if is_video(file):
+                    # Goes through the runner so timeouts and cancel() apply
+                    future = self._track(video_runner.submit(file, progress=partial(tracker.update, file)))
+                    error = _error(future)
+                else:
+                    try:
+                        clean_file(file, output=self.output)
+                        error = None
+                    except Exception as e:
+                        error = e
+                if error is None:
+                    successful += 1
+                else:
+                    failed += 1
+                self._record(file, error)
+                self._emit_result(file, error, tracker, on_result)
+        return successful, failed
+
+    def _emit_result(self, file, error, tracker, on_result):
+        tracker.finish(file)
+        if on_result:
+            on_result(file, error)
@@ -0,0 +1,330 @@
+"""Per-file metadata cleaning, independent of the GUI.
+
+ffmpeg-python and Pillow are imported on first use, so cleaning a JPEG, PNG,
+WebP, HEIF, GIF, TIFF or in-place video never loads them; neither is the
+archive module (and tarfile, zipfile) until an archive is cleaned.
+"""
+
+import os
+import threading
+import time
+
+from . import jpeg, png, webp, heif, gif, tiff, isobmff, ebml, probe, instrument, verify
+from .errors import FFmpegError, FFmpegTimeout, UnsupportedStructure
+from .formats import ARCHIVE_FORMATS, VIDEO_FORMATS, detect
+from .output import IN_PLACE, copy_file
+
+# Bump whenever clean_file starts removing something it used to keep, so
+# files recorded in a clean-state index get cleaned again
+CLEANER_VERSION = 3
+
+# A stream-copy remux that cannot manage this much is stuck, not slow
+TIMEOUT_BASE_S = 60
+TIMEOUT_MIN_BYTES_PER_S = 2 * 1024 * 1024
+
+
+def timeout_for(size):
+    return TIMEOUT_BASE_S + size / TIMEOUT_MIN_BYTES_PER_S
+
+
+def _spawn(stream, **pipes):
+    import ffmpeg
+
+    started = time.perf_counter()
+    process = ffmpeg.run_async(stream, **pipes)
+    instrument.count('ffmpeg.spawn_latency_s', time.perf_counter() - started)
+    return process
+
+
+def run_ffmpeg(stream, progress=None, timeout=None):
+    """Run an ffmpeg-python stream, optionally reporting output bytes.
+
+    With a progress callback ffmpeg writes machine-readable ``-progress``
+    records to stdout; for stream-copy remuxes the output size tracks the
+    input consumed closely enough to drive a byte-based progress bar.
+    ffmpeg is killed and FFmpegTimeout raised if it runs longer than
+    timeout seconds.
+    """
+    if progress is not None:
+        stream = stream.global_args('-progress', 'pipe:1', '-nostats')
+        process = _spawn(stream, pipe_stdout=True, pipe_stderr=True)
+    else:
+        process = _spawn(stream, pipe_stderr=True)
+    expired = threading.Event()
+
+    def kill():
+        expired.set()
+        process.kill()
+
+    # A timer rather than wait(timeout), which cannot interrupt reading stdout
+    timer = threading.Timer(timeout, kill) if timeout else None
+    if timer:
+        timer.daemon = True
+        timer.start()
+    try:
+        if progress is None:
+            _, err = process.communicate()
+        else:
+            stderr = []
+            # Drain stderr concurrently so a chatty ffmpeg cannot block on a full pipe
+            reader = threading.Thread(target=lambda: stderr.append(process.stderr.read()), daemon=True)
+            reader.start()
+            for line in process.stdout:
+                key, _, value = line.decode('ascii', 'replace').strip().partition('=')
+                if key == 'total_size' and value.isdigit():
+                    progress(int(value))
+            process.wait()
+            reader.join()
+            err = b''.join(stderr)
+    finally:
+        if timer:
+            timer.cancel()
+    if expired.is_set():
+        raise FFmpegTimeout(f"ffmpeg did not finish within {timeout:.0f} s")
+    if process.returncode:
+        raise FFmpegError(err)
+
+
+# Formats whose metadata can be blanked without rewriting the file
+IN_PLACE_ENGINES = {'mp4': isobmff, 'mov': isobmff, 'matroska': ebml, 'webm': ebml}
+
+
+def edit_in_place(engine, file, temp_file, output):
+    """Run engine.strip_in_place on file, or on a copy in temp_file.
+
+    The copy is made when output must leave originals untouched, or keep
+    them for verification; it is a reflink where the filesystem supports
+    it, so only the blocks the engine rewrites take new space. Returns True
+    if file itself was edited.
+    """
+    if output.edits_originals:
+        engine.strip_in_place(file)
+        return True
+    copy_file(file, temp_file)
+    try:
+        engine.strip_in_place(temp_file)
+    except UnsupportedStructure:
+        os.remove(temp_file)
+        raise
+    return False
+
+
+def strip_video_in_place(file, kind, temp_file, output=IN_PLACE):
+    """Blank metadata without a remux when the container allows it.
+
+    Returns None if the file needs a full remux instead, otherwise the
+    result of edit_in_place.
+    """
+    if kind not in IN_PLACE_ENGINES:
+        return None
+    engine = IN_PLACE_ENGINES[kind]
+    try:
+        # Media data is only copied, usually as a reflink, to keep originals
+        with instrument.span('in_place', file=file, engine=engine.__name__):
+            return edit_in_place(engine, file, temp_file, output)
+    except UnsupportedStructure:
+        return None  # Unusual layout, fall back to a full remux
+
+
+def remux_stream(file, temp_file, kind):
+    """Build the stream-copy ffmpeg command that drops all metadata."""
+    import ffmpeg
+
+    ext = VIDEO_FORMATS[kind]
+    stream = ffmpeg.input(file)
+    # Every video, audio and subtitle stream, not just ffmpeg's default pick
+    # of one each; cover art (attached pictures) is metadata
+    streams = [stream['V?'], stream['a?'], stream['s?']]
+    output_args = {
+        'map_metadata': -1,
+        'map_chapters': -1,
+        'fflags': '+bitexact',
+        'acodec': 'copy',
+        'vcodec': 'copy',
+        'scodec': 'copy'
+    }
+    
+    # Format-specific handling while keeping working formats unchanged
+    if ext == '.mkv':
+        output_args['f'] = 'matroska'
+    elif ext == '.mp4':
+        output_args['f'] = 'mp4'
+        output_args['movflags'] = '+faststart'
+    elif ext == '.mov':
+        output_args['f'] = 'mov'
+        output_args['movflags'] = '+faststart'  # QuickTime needs faststart too
+    elif ext == '.avi':
+        output_args['f'] = 'avi'
+        output_args['fflags'] += '+genpts'  # Ensure proper timestamps
+    elif ext == '.flv':
+        output_args['f'] = 'flv'
+        output_args['flv_metadata'] = ''  # Clear FLV specific metadata
+    elif ext == '.webm':
+        output_args['f'] = 'webm'
+        output_args['metadata'] = ''  # Clear WebM metadata
+    
+    stream = ffmpeg.output(*streams, temp_file, **output_args)
+    return stream.overwrite_output()
+
+
+# Each cleaner writes temp_file, or edits file in place (or leaves it as it
+# is) and returns True
+def _clean_video(file, temp_file, kind, progress, output):
+    edited = strip_video_in_place(file, kind, temp_file, output)
+    if edited is not None:
+        return edited
+    with instrument.span('ffmpeg', file=file):
+        run_ffmpeg(remux_stream(file, temp_file, kind), progress, timeout_for(os.path.getsize(file)))
+
+
+def _clean_jpeg(file, temp_file, kind, progress, output):
+    # Drop metadata segments without decoding, keeps the image bit-identical
+    with instrument.span('strip_jpeg', file=file):
+        jpeg.strip_jpeg(file, temp_file)
+
+
+def _clean_png(file, temp_file, kind, progress, output):
+    # Copy chunks through a fixed buffer, no pixel decode or recompression
+    with instrument.span('strip_png', file=file):
+        png.strip_png(file, temp_file)
+
+
+def _clean_webp(file, temp_file, kind, progress, output):
+    with instrument.span('strip_webp', file=file):
+        webp.strip_webp(file, temp_file)
+
+
+def _clean_heif(file, temp_file, kind, progress, output):
+    # Neither Pillow nor ffmpeg can write HEIC, so there is no fallback
+    with instrument.span('in_place', file=file, engine=heif.__name__):
+        return edit_in_place(heif, file, temp_file, output)
+
+
+def _clean_gif(file, temp_file, kind, progress, output):
+    # Block-level copy keeps every frame, palette and timing byte-identical
+    with instrument.span('strip_gif', file=file):
+        gif.strip_gif(file, temp_file)
+
+
+def _clean_tiff(file, temp_file, kind, progress, output):
+    # Pages are rewritten one at a time, strips and tiles copied undecoded
+    try:
+        with instrument.span('strip_tiff', file=file):
+            tiff.strip_tiff(file, temp_file)
+    except UnsupportedStructure:
+        _clean_pillow(file, temp_file, kind, progress, output)  # BigTIFF, old-style JPEG
+
+
+# Image.info keys that affect rendering and are passed back to the encoder;
+# everything else (exif, xmp, icc_profile, comment...) is left behind
+RENDERING_INFO = ('compression', 'dpi', 'transparency', 'background',
+                  'duration', 'loop', 'disposal')
+
+
+def _pillow_frame(frame):
+    """Copy a decoded frame with its palette, but without its metadata.
+
+    The copy is made in C; nothing is converted to Python objects per pixel.
+    It is a plain Image, so the TIFF encoder cannot carry over the source's
+    XMP, IPTC or Photoshop tags, and only RENDERING_INFO is kept.
+    """
+    cleaned = frame.copy()
+    cleaned.info = {key: frame.info[key] for key in RENDERING_INFO if key in frame.info}
+    return cleaned
+
+
+def _clean_pillow(file, temp_file, kind, progress, output):
+    from PIL import Image, ImageSequence
+
+    with Image.open(file) as img:
+        if getattr(img, 'n_frames', 1) == 1:
+            with instrument.span('pillow.decode', file=file):
+                img.load()
+            with instrument.span('pillow.encode', file=file):
+                frame = _pillow_frame(img)
+                frame.save(temp_file, format=kind, **frame.info)
+            return
+
+        # Multi-page TIFF: decode and write one page at a time
+        from PIL import TiffImagePlugin
+
+        with instrument.span('pillow.pages', file=file):
+            with open(temp_file, 'w+b') as f, TiffImagePlugin.AppendingTiffWriter(f) as writer:
+                for page in ImageSequence.Iterator(img):
+                    frame = _pillow_frame(page)
+                    frame.save(writer, format='TIFF', **frame.info)
+                    writer.newFrame()
+                    del frame  # Free the copy before the next page is decoded
+
+
+def _clean_archive(file, temp_file, kind, progress, output):
+    from . import archive
+
+    with instrument.span('archive', file=file):
+        cleaned = archive.clean_archive(file, temp_file, kind, output)
+    if not cleaned:
+        # No entry had metadata, so the original archive is kept as it is
+        os.remove(temp_file)
+        output.copy_unchanged(file)
+        return True
+
+
+# Detected format -> the one engine that cleans it
+CLEANERS = {
+    'jpeg': _clean_jpeg,
+    'png': _clean_png,
+    'webp': _clean_webp,
+    'heif': _clean_heif,
+    'gif': _clean_gif,
+    'tiff': _clean_tiff,
+    'bmp': _clean_pillow,
+}
+CLEANERS.update(dict.fromkeys(VIDEO_FORMATS, _clean_video))
+CLEANERS.update(dict.fromkeys(ARCHIVE_FORMATS, _clean_archive))
+
+
+def clean_file(file, force=False, progress=None, output=IN_PLACE):
+    """Remove metadata from file, replacing it in place.
+
+    The engine is chosen from the file's leading bytes (see formats.sniff),
+    falling back to its extension. Files the probe finds already clean are
+    left untouched unless force is set. progress(bytes_done) is called
+    during long ffmpeg remuxes. output (see output.Output) decides where
+    the cleaned file goes, and whether it is verified before it replaces
+    anything; with an output directory an already clean file is copied
+    there as is. Returns True if the file was rewritten.
+    """
+    if instrument.enabled():
+        instrument.count('bytes_in', os.path.getsize(file), file=file)
+    kind = detect(file)
+    if not force:
+        with instrument.span('probe', file=file):
+            clean = probe.is_clean(file, kind)
+        if clean:
+            output.copy_unchanged(file)
+            return False
+
+    output.prepare(file)
+    temp_file = output.staging_path(file)
+    try:
+        if kind not in CLEANERS:
+            raise Exception("Unrecognised file format")
+        if CLEANERS[kind](file, temp_file, kind, progress, output):
+            output.edited(file)
+            return True
+
+        if output.verify:
+            with instrument.span('verify', file=file):
+                verify.verify_file(file, temp_file, kind, timeout_for(os.path.getsize(file)))
+        output.commit(file, temp_file)
+        return True
+
+    except FFmpegError as e:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        error_message = e.stderr.decode() if e.stderr else 'Unknown FFmpeg error'
+        raise Exception(f"FFmpeg error: {error_message}")
+    except Exception as e:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise Exception(f"Failed to clean metadata: {str(e)}")
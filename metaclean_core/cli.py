@@ -0,0 +1,337 @@
+"""Headless command line interface.
+
+Usage: python -m metaclean_core [--recursive] [--jobs N] [--json] PATH...
+       python -m metaclean_core --output-dir DIR [--durability dir] PATH...
+       python -m metaclean_core --archives DATASET.tar.gz
+       python -m metaclean_core --watch [--recursive] FOLDER...
+       python -m metaclean_core --resume JOURNAL
+"""
+
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+
+from . import instrument
+from .batch import BatchEngine, default_jobs
+from .discovery import discover_sized
+from .formats import ARCHIVE_EXTENSIONS, SUPPORTED_EXTENSIONS
+from .index import CleanIndex, default_index_path
+from .journal import Journal
+from .output import DURABILITY_MODES, Output
+from .probe import probe_file
+from .progress import format_progress
+from .watch import DEFAULT_SETTLE_S, Watcher
+
+
+RATE_SUFFIXES = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+
+
+def parse_rate(text):
+    """Parse a byte rate such as 500K, 200M or 1.5G (binary units)."""
+    scale = RATE_SUFFIXES.get(text[-1:].upper(), 1)
+    number = text[:-1] if scale > 1 else text
+    try:
+        rate = float(number) * scale
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid rate: {text!r}") from None
+    if rate <= 0:
+        raise argparse.ArgumentTypeError("rate must be positive")
+    return rate
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="metaclean",
+        description="Remove metadata from video and image files.",
+    )
+    parser.add_argument("paths", nargs="*", metavar="PATH",
+                        help="files, folders or glob patterns to clean")
+    parser.add_argument("-r", "--recursive", action="store_true",
+                        help="descend into sub-folders (and let ** match them in globs)")
+    parser.add_argument("-j", "--jobs", type=int, default=default_jobs(),
+                        help="number of worker processes (default: %(default)s)")
+    parser.add_argument("--io-jobs", type=int, metavar="N",
+                        help="how many disk-bound jobs (videos, archives, huge images) may run at "
+                             "once, alongside the image workers (default: min(4, jobs))")
+    parser.add_argument("--max-bandwidth", type=parse_rate, metavar="RATE",
+                        help="start files no faster than RATE bytes/s on average, e.g. 200M "
+                             "(suffixes K, M, G)")
+    parser.add_argument("--index", nargs="?", const=default_index_path(), metavar="DB",
+                        help="skip files unchanged since they were last cleaned, tracked in "
+                             "an SQLite index (default location: %(const)s)")
+    parser.add_argument("--hash", action="store_true",
+                        help="with --index, also compare content hashes so touched but "
+                             "unmodified files are skipped")
+    parser.add_argument("--journal", metavar="FILE",
+                        help="record each file's progress in FILE so an interrupted run can be "
+                             "continued with --resume (an existing journal is replaced)")
+    parser.add_argument("--resume", metavar="JOURNAL",
+                        help="continue the run recorded in JOURNAL: skip finished files, redo "
+                             "interrupted ones and report the files that failed")
+    parser.add_argument("-o", "--output-dir", metavar="DIR",
+                        help="write cleaned copies under DIR and leave the originals untouched; "
+                             "files inside a folder given as PATH keep their relative path")
+    parser.add_argument("--staging-dir", metavar="DIR",
+                        help="write files to DIR while they are cleaned, then rename them into "
+                             "place (ignored for destinations on another filesystem)")
+    parser.add_argument("--durability", choices=DURABILITY_MODES, default="none",
+                        help="fsync nothing, each cleaned file, or each file and its folder "
+                             "before moving on (default: %(default)s)")
+    parser.add_argument("--verify", action="store_true",
+                        help="before replacing anything, check that the streams or pixels of each "
+                             "cleaned file match the original and that no metadata is left")
+    parser.add_argument("--archives", action="store_true",
+                        help="also clean the media inside ZIP and TAR archives (.tar.gz, .tar.xz "
+                             "too), one entry at a time; other entries are copied unchanged")
+    parser.add_argument("-n", "--dry-run", action="store_true",
+                        help="only report the metadata found, do not modify anything")
+    parser.add_argument("--progress", action="store_true",
+                        help="report bytes done, throughput and ETA while cleaning")
+    parser.add_argument("--json", action="store_true",
+                        help="write one JSON object per line instead of text")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep running and clean files as they are added to or changed in "
+                             "the given folders (existing files are left alone)")
+    parser.add_argument("--settle", type=float, default=DEFAULT_SETTLE_S, metavar="SECONDS",
+                        help="with --watch, how long a file must stay unchanged before it is "
+                             "cleaned (default: %(default)s)")
+    parser.add_argument("--poll", action="store_true",
+                        help="with --watch, poll the folders instead of using inotify")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="record per-stage timings and byte counters to FILE")
+    parser.add_argument("--trace-format", choices=("jsonl", "chrome"), default="jsonl",
+                        help="JSON lines, or Chrome trace events for chrome://tracing and Perfetto")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="run the batch under cProfile (stats saved to FILE) and tracemalloc; "
+                             "use --jobs 1 to include the cleaning itself")
+    return parser
+
+
+class Reporter:
+    """Writes per-file results either as text or as JSON lines."""
+
+    def __init__(self, as_json, stream=None):
+        self.as_json = as_json
+        self.stream = stream or sys.stdout
+        self.lock = threading.Lock()  # Progress may be reported from worker threads
+
+    def emit(self, event, text, **fields):
+        if self.as_json:
+            line = json.dumps(dict(event=event, **fields))
+        else:
+            line = f"[*] {text}"
+        with self.lock:
+            print(line, file=self.stream, flush=True)
+
+    def result(self, file, error):
+        if error is None:
+            self.emit("result", f"Successfully cleaned: {file}", file=file, ok=True)
+        else:
+            self.emit("result", f"Error processing {file}: {error}", file=file, ok=False, error=str(error))
+
+    def skipped(self, file):
+        self.emit("skip", f"Already clean: {file}", file=file)
+
+    def report(self, report):
+        findings = report["findings"]
+        if findings:
+            text = f"Metadata in {report['file']}: {', '.join(findings)}"
+        else:
+            text = f"Already clean: {report['file']}"
+        self.emit("probe", text, **report)
+
+    def progress(self, snapshot):
+        self.emit("progress", format_progress(snapshot), **snapshot)
+
+    def summary(self, successful, failed):
+        total = successful + failed
+        self.emit("summary", f"Completed: {successful} succeeded, {failed} failed out of {total} files",
+                  total=total, successful=successful, failed=failed)
+
+
+def dry_run(files, reporter):
+    dirty = failed = 0
+    for file in files:
+        try:
+            report = probe_file(file)
+        except Exception as e:
+            failed += 1
+            reporter.result(file, e)
+            continue
+        dirty += bool(report["findings"])
+        reporter.report(report)
+    reporter.emit("summary", f"{dirty} of {len(files)} files contain metadata",
+                  total=len(files), with_metadata=dirty, failed=failed)
+    return 1 if failed else 0
+
+
+def extensions(args):
+    return SUPPORTED_EXTENSIONS + ARCHIVE_EXTENSIONS if args.archives else SUPPORTED_EXTENSIONS
+
+
+def build_output(args):
+    return Output(args.output_dir, roots=args.paths, staging_dir=args.staging_dir,
+                  durability=args.durability, verify=args.verify)
+
+
+def build_engine(args, index=None, journal=None, output=None):
+    return BatchEngine(jobs=args.jobs, io_jobs=args.io_jobs, index=index, journal=journal,
+                       output=output, bandwidth=args.max_bandwidth)
+
+
+def clean(files, args, reporter, journal=None, output=None, sizes=None):
+    index = CleanIndex(args.index, hash_content=args.hash) if args.index else None
+    engine = build_engine(args, index, journal, output)
+    try:
+        return engine.run(files, on_result=reporter.result, on_skip=reporter.skipped,
+                          on_progress=reporter.progress if args.progress else None, sizes=sizes)
+    except KeyboardInterrupt:
+        engine.cancel()  # Unfinished files stay pending in the journal
+        raise
+    finally:
+        if index:
+            index.close()
+
+
+def resume(args, reporter):
+    # The output the interrupted run recorded wins, so originals stay untouched
+    journal = Journal(args.resume, resume=True, output=build_output(args))
+    try:
+        counts = journal.counts()
+        files = journal.prepare_resume()
+        previous_failures = counts["failed"]
+        reporter.emit("resume", f"Resuming: {counts['done']} done, {len(files)} remaining, "
+                                f"{previous_failures} failed earlier",
+                      done=counts["done"], remaining=len(files), failed=previous_failures)
+        successful, failed = clean(files, args, reporter, journal, journal.output) if files else (0, 0)
+        for file, error in journal.failures().items():
+            reporter.emit("failure", f"Failed: {file}: {error}", file=file, error=error)
+    finally:
+        journal.close()
+    return successful, failed + previous_failures
+
+
+def watch(args, reporter):
+    index = CleanIndex(args.index, hash_content=args.hash) if args.index else None
+    engine = build_engine(args, index, output=build_output(args))
+    watcher = Watcher(args.paths, engine, recursive=args.recursive, settle=args.settle,
+                      polling=args.poll, extensions=extensions(args))
+
+    # SIGTERM (service managers) stops the watch as cleanly as Ctrl+C
+    signal.signal(signal.SIGTERM, lambda *_: watcher.stop())
+    reporter.emit("watch", f"Watching {', '.join(args.paths)}", paths=args.paths)
+    successful = failed = 0
+
+    def on_result(file, error):
+        nonlocal successful, failed
+        if error is None:
+            successful += 1
+        else:
+            failed += 1
+        reporter.result(file, error)
+
+    try:
+        watcher.run(on_result=on_result, on_skip=reporter.skipped)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if index:
+            index.close()
+    return successful, failed
+
+
+def profiled(stats_path, func, *args):
+    import cProfile
+    import pstats
+    import tracemalloc
+
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    try:
+        return profiler.runcall(func, *args)
+    finally:
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        profiler.dump_stats(stats_path)
+
+        print(f"Profile saved to {stats_path}", file=sys.stderr)
+        pstats.Stats(profiler, stream=sys.stderr).sort_stats("cumulative").print_stats(15)
+        print(f"Peak traced memory: {peak / 1e6:.1f} MB, top allocations:", file=sys.stderr)
+        for stat in snapshot.statistics("lineno")[:10]:
+            print(f"  {stat}", file=sys.stderr)
+
+
+def _inside_any(path, folders):
+    path = os.path.realpath(path)
+    for folder in folders:
+        folder = os.path.realpath(folder)
+        if path == folder or path.startswith(folder + os.sep):
+            return True
+    return False
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not args.paths and not args.resume:
+        parser.error("the following arguments are required: PATH")
+    if args.output_dir and args.index:
+        # The index records originals as clean, which they are not
+        parser.error("--index cannot be combined with --output-dir")
+    if args.output_dir and args.watch and _inside_any(args.output_dir, args.paths):
+        parser.error("--output-dir must be outside the watched folders")
+    reporter = Reporter(args.json)
+
+    if args.resume:
+        if not os.path.isfile(args.resume):
+            print(f"No journal at {args.resume}", file=sys.stderr)
+            return 2
+        successful, failed = resume(args, reporter)
+        reporter.summary(successful, failed)
+        return 1 if failed else 0
+
+    if args.watch:
+        missing = [path for path in args.paths if not os.path.isdir(path)]
+        if missing:
+            print(f"Not a folder: {', '.join(missing)}", file=sys.stderr)
+            return 2
+        successful, failed = watch(args, reporter)
+        reporter.summary(successful, failed)
+        return 1 if failed else 0
+
+    if args.trace:
+        instrument.start()
+    try:
+        with instrument.span("discover"):
+            # Sized while the folders are scanned, so the batch can be scheduled by size
+            sizes = dict(discover_sized(args.paths, recursive=args.recursive, extensions=extensions(args)))
+            files = list(sizes)
+        if not files:
+            print("No supported files found", file=sys.stderr)
+            return 2
+
+        if args.dry_run:
+            return dry_run(files, reporter)
+
+        output = build_output(args)
+        journal = Journal(args.journal, output=output) if args.journal else None
+        try:
+            if args.profile:
+                successful, failed = profiled(args.profile, clean, files, args, reporter, journal,
+                                                output, sizes)
+            else:
+                successful, failed = clean(files, args, reporter, journal, output, sizes)
+        finally:
+            if journal:
+                journal.close()
+    finally:
+        if args.trace:
+            events = instrument.finish(args.trace, args.trace_format)
+            for name, (n, total) in instrument.summarize(events).items():
+                print(f"{name:16} {n:8} x {total:10.3f} s", file=sys.stderr)
+    reporter.summary(successful, failed)
+    return 1 if failed else 0
@@ -0,0 +1,70 @@
+"""Finding the files to clean."""
+
+import glob
+import os
+
+from .formats import SUPPORTED_EXTENSIONS
+
+
+def is_supported(file, extensions=SUPPORTED_EXTENSIONS):
+    return file.lower().endswith(extensions)
+
+
+def _walk(folder, recursive):
+    """Yield a DirEntry for each file in folder, and below it if recursive."""
+    subfolders = []
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if entry.is_file():
+                yield entry
+            elif recursive and entry.is_dir(follow_symlinks=False):
+                subfolders.append(entry.path)
+    for subfolder in subfolders:
+        try:
+            yield from _walk(subfolder, recursive)
+        except OSError:
+            pass  # Unreadable sub-folder, skipped like os.walk does
+
+
+def _matches(paths, recursive, extensions):
+    """Yield (file, DirEntry or None) for each supported file under paths."""
+    if isinstance(paths, str):
+        paths = [paths]
+    for path in paths:
+        if any(c in path for c in "*?["):
+            matches = sorted(glob.glob(path, recursive=recursive))
+        else:
+            matches = [path]
+        for match in matches:
+            if os.path.isdir(match):
+                for entry in _walk(match, recursive):
+                    if is_supported(entry.path, extensions):
+                        yield entry.path, entry
+            elif os.path.isfile(match) and is_supported(match, extensions):
+                yield match, None
+
+
+def discover(paths, recursive=False, extensions=SUPPORTED_EXTENSIONS):
+    """Yield supported files under paths, which may be files, folders or globs.
+
+    Folders are only searched below their top level when recursive is set,
+    which also lets ``**`` in glob patterns match nested folders.
+    """
+    for file, _ in _matches(paths, recursive, extensions):
+        yield file
+
+
+def discover_sized(paths, recursive=False, extensions=SUPPORTED_EXTENSIONS):
+    """Like discover(), but yield (file, size in bytes) pairs.
+
+    Sizes come from the folder scan where the OS provides them (Windows),
+    otherwise from one stat per file, so a batch can be scheduled by size
+    (see schedule) without opening anything. Files that vanish in between
+    are left out.
+    """
+    for file, entry in _matches(paths, recursive, extensions):
+        try:
+            size = entry.stat().st_size if entry else os.path.getsize(file)
+        except OSError:
+            continue
+        yield file, size
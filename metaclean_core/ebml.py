@@ -0,0 +1,252 @@
+"""In-place metadata removal for Matroska and WebM files.
+
+Tags, Attachments and Chapters, the identifying fields of Info (title, muxing
+and writing application, date) and track names are overwritten with EBML Void
+elements of exactly the same length. Clusters are never touched, so cleaning
+a multi-gigabyte recording costs only as much I/O as the metadata it holds.
+"""
+
+from .errors import UnsupportedStructure
+from .isobmff import zero_fill
+
+EBML = 0x1A45DFA3
+DOC_TYPE = 0x4282
+SEGMENT = 0x18538067
+SEEK_HEAD = 0x114D9B74
+SEEK = 0x4DBB
+SEEK_ID = 0x53AB
+SEEK_POSITION = 0x53AC
+INFO = 0x1549A966
+TRACKS = 0x1654AE6B
+TRACK_ENTRY = 0xAE
+CLUSTER = 0x1F43B675
+CHAPTERS = 0x1043A770
+ATTACHMENTS = 0x1941A469
+TAGS = 0x1254C367
+VOID = 0xEC
+CRC32 = 0xBF
+
+# Level-1 elements that are dropped entirely
+METADATA_ELEMENTS = {TAGS, ATTACHMENTS, CHAPTERS}
+# Title, MuxingApp, WritingApp, DateUTC
+INFO_FIELDS = {0x7BA9, 0x4D80, 0x5741, 0x4461}
+TRACK_NAME = 0x536E
+
+DOC_TYPES = {b"matroska", b"webm"}
+
+ELEMENT_NAMES = {
+    TAGS: "Tags", ATTACHMENTS: "Attachments", CHAPTERS: "Chapters",
+    0x7BA9: "Title", 0x4D80: "MuxingApp", 0x5741: "WritingApp", 0x4461: "DateUTC",
+    TRACK_NAME: "track Name",
+}
+
+
+def _read_vint(f, keep_marker):
+    first = f.read(1)
+    if not first:
+        raise UnsupportedStructure("Unexpected end of file in EBML header")
+    b = first[0]
+    if b == 0:
+        raise UnsupportedStructure("Invalid EBML variable-length integer")
+    width = 9 - b.bit_length()
+    rest = f.read(width - 1)
+    if len(rest) != width - 1:
+        raise UnsupportedStructure("Unexpected end of file in EBML header")
+    value = b if keep_marker else b & ((1 << (8 - width)) - 1)
+    for c in rest:
+        value = (value << 8) | c
+    unknown = not keep_marker and value == (1 << (7 * width)) - 1
+    return value, width, unknown
+
+
+def read_element_header(f, pos):
+    """Return (id, header_size, data_size) for the element at pos.
+
+    data_size is None for elements of unknown size.
+    """
+    f.seek(pos)
+    element_id, id_width, _ = _read_vint(f, keep_marker=True)
+    size, size_width, unknown = _read_vint(f, keep_marker=False)
+    return element_id, id_width + size_width, None if unknown else size
+
+
+def iter_elements(f, start, end):
+    """Yield (offset, id, header_size, data_size) for children in [start, end)."""
+    pos = start
+    while pos < end:
+        element_id, header, size = read_element_header(f, pos)
+        if size is None:
+            if element_id == CLUSTER:
+                yield pos, element_id, header, None
+                return
+            raise UnsupportedStructure(f"Unknown-size element 0x{element_id:X} at offset {pos}")
+        if pos + header + size > end:
+            raise UnsupportedStructure(f"Element 0x{element_id:X} at offset {pos} overruns its parent")
+        yield pos, element_id, header, size
+        pos += header + size
+
+
+def _read_uint(f, pos, size):
+    f.seek(pos)
+    return int.from_bytes(f.read(size), "big")
+
+
+def void_header(length):
+    """Return a Void element header for an element of the given total length."""
+    for width in range(1, 9):
+        data_size = length - 1 - width
+        if data_size < 0:
+            break
+        if data_size < (1 << (7 * width)) - 1:
+            return bytes((VOID,)) + ((1 << (7 * width)) | data_size).to_bytes(width, "big")
+    raise UnsupportedStructure(f"Cannot void an element of {length} bytes")
+
+
+class _Planner:
+    def __init__(self, f, segment_data, segment_end):
+        self.f = f
+        self.segment_data = segment_data
+        self.segment_end = segment_end
+        self.voids = {}  # offset -> total length
+        self.masters = []  # (start, end, crc_offset, crc_length) of edited masters
+        self.seek_entries = []  # (offset, length, target_id, target_offset)
+        self.visited = set()
+
+    def void(self, pos, length):
+        self.voids[pos] = length
+
+    def children(self, start, end):
+        """Iterate children of a master, remembering any CRC-32 it carries."""
+        crc = None
+        for pos, element_id, header, size in iter_elements(self.f, start, end):
+            if element_id == CRC32:
+                crc = (pos, header + size)
+            yield pos, element_id, header, size
+        if crc:
+            self.masters.append((start, end) + crc)
+
+    def visit(self, pos, element_id, header, size):
+        if pos in self.visited:
+            return
+        self.visited.add(pos)
+        data = pos + header
+        if element_id in METADATA_ELEMENTS:
+            self.void(pos, header + size)
+        elif element_id == INFO:
+            for child, child_id, child_header, child_size in self.children(data, data + size):
+                if child_id in INFO_FIELDS:
+                    self.void(child, child_header + child_size)
+        elif element_id == TRACKS:
+            for entry, entry_id, entry_header, entry_size in self.children(data, data + size):
+                if entry_id != TRACK_ENTRY:
+                    continue
+                entry_data = entry + entry_header
+                for child, child_id, child_header, child_size in self.children(entry_data, entry_data + entry_size):
+                    if child_id == TRACK_NAME:
+                        self.void(child, child_header + child_size)
+        elif element_id == SEEK_HEAD:
+            self.visit_seek_head(data, data + size)
+
+    def visit_seek_head(self, start, end):
+        targets = []
+        for seek, seek_id, seek_header, seek_size in self.children(start, end):
+            if seek_id != SEEK:
+                continue
+            target_id = target_pos = None
+            seek_data = seek + seek_header
+            for child, child_id, child_header, child_size in iter_elements(self.f, seek_data, seek_data + seek_size):
+                if child_id == SEEK_ID:
+                    target_id = _read_uint(self.f, child + child_header, child_size)
+                elif child_id == SEEK_POSITION:
+                    target_pos = self.segment_data + _read_uint(self.f, child + child_header, child_size)
+            if target_id is None or target_pos is None:
+                continue
+            self.seek_entries.append((seek, seek_header + seek_size, target_id, target_pos))
+            targets.append((target_id, target_pos))
+
+        for target_id, target_pos in targets:
+            if target_id not in METADATA_ELEMENTS | {INFO, TRACKS, SEEK_HEAD}:
+                continue
+            if not self.segment_data <= target_pos < self.segment_end:
+                continue
+            element_id, header, size = read_element_header(self.f, target_pos)
+            if element_id != target_id or size is None:
+                continue  # Stale SeekHead entry
+            if target_pos + header + size > self.segment_end:
+                raise UnsupportedStructure(f"Element 0x{element_id:X} overruns the segment")
+            self.visit(target_pos, element_id, header, size)
+
+    def finish(self):
+        # Seek entries pointing at removed elements are dangling now
+        for pos, length, target_id, target_pos in self.seek_entries:
+            if target_pos in self.voids and target_id in METADATA_ELEMENTS:
+                self.void(pos, length)
+        # A master whose children changed can no longer carry a valid CRC-32
+        for start, end, crc_pos, crc_length in self.masters:
+            if crc_pos not in self.voids and any(start <= pos < end for pos in self.voids):
+                self.void(crc_pos, crc_length)
+        return sorted(self.voids.items())
+
+
+def plan_edits(f, file_size):
+    """Return [(offset, length)] of elements to void, without writing."""
+    element_id, header, size = read_element_header(f, 0)
+    if element_id != EBML or size is None:
+        raise UnsupportedStructure("Not an EBML file")
+    doc_type = None
+    for pos, child_id, child_header, child_size in iter_elements(f, header, header + size):
+        if child_id == DOC_TYPE:
+            f.seek(pos + child_header)
+            doc_type = f.read(child_size).rstrip(b"\x00")
+    if doc_type not in DOC_TYPES:
+        raise UnsupportedStructure(f"Unsupported EBML document type {doc_type!r}")
+
+    segment = header + size
+    element_id, header, size = read_element_header(f, segment)
+    if element_id != SEGMENT:
+        raise UnsupportedStructure("No Matroska segment found")
+    segment_data = segment + header
+    segment_end = file_size if size is None else segment_data + size
+    if segment_end > file_size:
+        raise UnsupportedStructure("Truncated Matroska segment")
+
+    planner = _Planner(f, segment_data, segment_end)
+    # Level-1 elements before the first cluster, then whatever the
+    # SeekHead points at (Tags are usually written after the clusters)
+    for pos, element_id, header, size in iter_elements(f, segment_data, segment_end):
+        if element_id == CLUSTER:
+            break
+        planner.visit(pos, element_id, header, size)
+    return planner.finish()
+
+
+def find_metadata(path):
+    """Return descriptions of the elements strip_in_place would void."""
+    with open(path, "rb") as f:
+        f.seek(0, 2)
+        plan = plan_edits(f, f.tell())
+        found = []
+        for pos, _ in plan:
+            element_id, _, _ = read_element_header(f, pos)
+            if element_id in (SEEK, CRC32):
+                continue  # Only voided because of the other edits
+            found.append(ELEMENT_NAMES.get(element_id, f"element 0x{element_id:X}"))
+    return found
+
+
+def strip_in_place(path):
+    """Void metadata elements in path without rewriting the file.
+
+    Returns the number of elements voided. Raises UnsupportedStructure,
+    before anything is written, if the file needs a full remux instead.
+    """
+    with open(path, "r+b") as f:
+        f.seek(0, 2)
+        plan = plan_edits(f, f.tell())
+
+        for pos, length in plan:
+            header = void_header(length)
+            f.seek(pos)
+            f.write(header)
+            zero_fill(f, pos + len(header), length - len(header))
+    return len(plan)
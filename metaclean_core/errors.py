@@ -0,0 +1,28 @@
+"""Exceptions shared by the cleaning engines."""
+
+
+class UnsupportedStructure(ValueError):
+    """The file layout is not one we can safely edit in place."""
+
+
+class FFmpegError(Exception):
+    """ffmpeg exited with an error; stderr holds (the tail of) its output."""
+
+    def __init__(self, stderr):
+        super().__init__("ffmpeg exited with an error")
+        self.stderr = stderr
+
+
+class FFmpegTimeout(Exception):
+    """ffmpeg ran longer than its timeout and was killed."""
+
+
+class Cancelled(Exception):
+    """The batch was stopped before this file was cleaned."""
+
+    def __init__(self):
+        super().__init__("Cancelled")
+
+
+class VerificationError(Exception):
+    """The cleaned file does not match the original; it was not committed."""
@@ -0,0 +1,227 @@
+"""Asyncio driver for the video remux path.
+
+Every ffmpeg process runs as an asyncio subprocess on one event loop, so a
+batch can keep many remuxes going without a thread per job. Each run gets a
+timeout scaled to the file size, stderr is streamed and only its tail kept,
+and cancelling a job kills the ffmpeg child and removes its staged file.
+Verification hashes the original and staged streams once the remux slot
+is free again, so it overlaps with the next file's remux.
+"""
+
+import asyncio
+import os
+import subprocess
+import threading
+from functools import partial
+
+import ffmpeg
+
+from . import instrument, probe, verify
+from .cleaner import clean_file, remux_stream, strip_video_in_place, timeout_for
+from .errors import FFmpegError, FFmpegTimeout
+from .formats import VIDEO_FORMATS, detect
+from .output import IN_PLACE
+
+STDERR_LIMIT = 64 * 1024
+
+
+async def run_ffmpeg_async(args, timeout=None, progress=None):
+    """Run an ffmpeg command line, killing it on timeout or cancellation.
+
+    Raises FFmpegError with the last STDERR_LIMIT bytes of stderr if ffmpeg
+    fails, and FFmpegTimeout if it runs longer than timeout seconds.
+    """
+    if progress is not None:
+        args = args[:1] + ['-progress', 'pipe:1', '-nostats'] + args[1:]
+    process = await asyncio.create_subprocess_exec(
+        *args,
+        stdin=subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE if progress else subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stderr_tail = bytearray()
+
+    async def read_stderr():
+        while True:
+            chunk = await process.stderr.read(STDERR_LIMIT)
+            if not chunk:
+                break
+            stderr_tail.extend(chunk)
+            del stderr_tail[:-STDERR_LIMIT]
+
+    async def read_progress():
+        if progress is None:
+            return
+        async for line in process.stdout:
+            key, _, value = line.decode('ascii', 'replace').strip().partition('=')
+            if key == 'total_size' and value.isdigit():
+                progress(int(value))
+
+    readers = [asyncio.ensure_future(read_stderr()), asyncio.ensure_future(read_progress())]
+    try:
+        await asyncio.wait_for(process.wait(), timeout)
+    except asyncio.TimeoutError:
+        raise FFmpegTimeout(f"ffmpeg did not finish within {timeout:.0f} s")
+    finally:
+        # Kills ffmpeg on timeout or cancellation; either way the pipes then
+        # reach EOF and the readers finish
+        await _kill(process)
+        await asyncio.gather(*readers)
+
+    if process.returncode:
+        raise FFmpegError(bytes(stderr_tail))
+
+
+async def _kill(process):
+    if process.returncode is None:
+        process.kill()
+        await process.wait()
+
+
+def _remove(path):
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+async def _stream_hashes_async(file, timeout):
+    process = await asyncio.create_subprocess_exec(
+        *verify.stream_hash_args(file),
+        stdin=subprocess.DEVNULL, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        out, err = await asyncio.wait_for(process.communicate(), timeout)
+    except asyncio.TimeoutError:
+        raise FFmpegTimeout(f"ffmpeg did not finish hashing within {timeout:.0f} s")
+    finally:
+        await _kill(process)
+    if process.returncode:
+        raise FFmpegError(err[-STDERR_LIMIT:])
+    return verify.parse_stream_hashes(out)
+
+
+async def verify_video_async(original, cleaned, kind, timeout=None):
+    """Async counterpart of verify.verify_file for videos.
+
+    Both files are hashed at once; if either fails the other ffmpeg is killed.
+    """
+    if timeout is None:
+        timeout = timeout_for(os.path.getsize(original))
+    tasks = [asyncio.ensure_future(_stream_hashes_async(file, timeout)) for file in (original, cleaned)]
+    try:
+        hashes = await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    verify.compare_streams(*hashes)
+    await asyncio.get_running_loop().run_in_executor(None, verify.check_metadata, cleaned, kind)
+
+
+async def clean_video_async(file, force=False, progress=None, timeout=None, output=IN_PLACE,
+                            slot=None, verify_slot=None):
+    """Async counterpart of clean_file for videos; see clean_file.
+
+    The probe and the in-place edit or remux run while holding the
+    semaphore slot, and verification (with output.verify) while holding
+    verify_slot, so one file is verified while the next one is remuxed.
+    Without them the file has no limit to share.
+    """
+    loop = asyncio.get_running_loop()
+    kind = detect(file)
+    if kind not in VIDEO_FORMATS:
+        # Named like a video but is not one: no ffmpeg involved
+        return await loop.run_in_executor(None, partial(clean_file, file, force, output=output))
+
+    temp_file = None
+    try:
+        async with slot or asyncio.Semaphore():
+            # Probing, in-place edits and commits are short blocking reads/writes
+            if not force and await loop.run_in_executor(None, probe.is_clean, file, kind):
+                await loop.run_in_executor(None, output.copy_unchanged, file)
+                return False
+
+            output.prepare(file)
+            temp_file = output.staging_path(file)
+            edited = await loop.run_in_executor(None, strip_video_in_place, file, kind, temp_file, output)
+            if edited:
+                await loop.run_in_executor(None, output.edited, file)
+                return True
+            if edited is None:
+                if timeout is None:
+                    timeout = timeout_for(os.path.getsize(file))
+                args = ffmpeg.compile(remux_stream(file, temp_file, kind))
+                with instrument.span('ffmpeg', file=file):
+                    await run_ffmpeg_async(args, timeout, progress)
+            # Otherwise a copy was edited, because the original must be kept
+
+        if output.verify:
+            async with verify_slot or asyncio.Semaphore():
+                with instrument.span('verify', file=file):
+                    await verify_video_async(file, temp_file, kind, timeout)
+        await loop.run_in_executor(None, output.commit, file, temp_file)
+        return True
+    except asyncio.CancelledError:
+        _remove(temp_file)
+        raise
+    except FFmpegError as e:
+        _remove(temp_file)
+        error_message = e.stderr.decode(errors='replace') if e.stderr else 'Unknown FFmpeg error'
+        raise Exception(f"FFmpeg error: {error_message}")
+    except Exception as e:
+        _remove(temp_file)
+        raise Exception(f"Failed to clean metadata: {str(e)}")
+
+
+class VideoRunner:
+    """Runs clean_video_async jobs on an event loop in a background thread.
+
+    submit() returns a concurrent.futures.Future; cancelling it kills the
+    job's ffmpeg process. At most concurrency jobs are remuxed and, with
+    output.verify, at most concurrency more verified at once.
+    """
+
+    def __init__(self, concurrency, timeout=None, output=IN_PLACE):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.output = output
+        self.semaphore = self.verify_semaphore = None
+        self.futures = set()
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="metaclean-ffmpeg", daemon=True)
+        self.thread.start()
+
+    def submit(self, file, progress=None):
+        future = asyncio.run_coroutine_threadsafe(self._run(file, progress), self.loop)
+        self.futures.add(future)
+        future.add_done_callback(self.futures.discard)
+        return future
+
+    async def _run(self, file, progress):
+        if self.semaphore is None:
+            # Created on the loop thread so it binds to this loop on every Python version
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+            self.verify_semaphore = asyncio.Semaphore(self.concurrency)
+        return await clean_video_async(file, progress=progress, timeout=self.timeout, output=self.output,
+                                       slot=self.semaphore, verify_slot=self.verify_semaphore)
+
+    def close(self):
+        """Cancel unfinished jobs, wait for their cleanup and stop the loop."""
+        # Cancelling an already cancelled future is a no-op, so jobs are not
+        # interrupted a second time while killing their ffmpeg process
+        for future in list(self.futures):
+            future.cancel()
+
+        async def drain():
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        asyncio.run_coroutine_threadsafe(drain(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,135 @@
+"""File types MetaClean knows how to clean.
+
+Extensions decide which files are picked up; the leading bytes decide how a
+file is cleaned. sniff() recognises every supported format from its first
+SNIFF_SIZE bytes, so a misnamed file still goes straight to the right
+engine.
+"""
+
+import os
+
+VIDEO_EXTENSIONS = ('.mp4', '.mkv', '.avi', '.mov', '.flv', '.webm')
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff', '.tif', '.webp', '.heic')
+SUPPORTED_EXTENSIONS = VIDEO_EXTENSIONS + IMAGE_EXTENSIONS
+# Archives whose media entries can be cleaned (see archive.py); opt-in
+ARCHIVE_EXTENSIONS = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.xz', '.txz')
+
+# Enough for every signature below, including the ftyp brand list of
+# ISO-BMFF files and the DocType in a Matroska EBML header
+SNIFF_SIZE = 512
+
+# Detected video format -> extension whose muxer settings remux it
+VIDEO_FORMATS = {
+    'mp4': '.mp4', 'mov': '.mov', 'matroska': '.mkv', 'webm': '.webm',
+    'avi': '.avi', 'flv': '.flv',
+}
+IMAGE_FORMATS = ('jpeg', 'png', 'gif', 'bmp', 'tiff', 'webp', 'heif')
+ARCHIVE_FORMATS = ('zip', 'tar')
+
+# Used when the content is not recognised, so the engine's own error is reported
+EXTENSION_FORMATS = {
+    '.mp4': 'mp4', '.mov': 'mov', '.mkv': 'matroska', '.webm': 'webm',
+    '.avi': 'avi', '.flv': 'flv', '.jpg': 'jpeg', '.jpeg': 'jpeg', '.png': 'png',
+    '.gif': 'gif', '.bmp': 'bmp', '.tiff': 'tiff', '.tif': 'tiff', '.webp': 'webp',
+    '.heic': 'heif', '.zip': 'zip', '.tar': 'tar', '.tar.gz': 'tar', '.tgz': 'tar',
+    '.tar.xz': 'tar', '.txz': 'tar',
+}
+# Suffixes with more than one dot, which splitext would cut short
+COMPOUND_EXTENSIONS = ('.tar.gz', '.tar.xz')
+
+HEIF_BRANDS = {b'heic', b'heix', b'heim', b'heis', b'hevc', b'hevx', b'mif1', b'msf1', b'avif', b'avis'}
+QUICKTIME_BRANDS = {b'qt  '}
+
+
+def extension(file):
+    lower = file.lower()
+    for suffix in COMPOUND_EXTENSIONS:
+        if lower.endswith(suffix):
+            return suffix
+    return os.path.splitext(lower)[1]
+
+
+def is_video(file):
+    return extension(file) in VIDEO_EXTENSIONS
+
+
+def _ftyp_format(head):
+    # size(4) 'ftyp' major_brand(4) minor_version(4) compatible_brands(4 each)
+    size = int.from_bytes(head[0:4], 'big')
+    brands = [head[8:12]]
+    end = min(size, len(head))
+    brands.extend(head[i:i + 4] for i in range(16, end - 3, 4))
+    # A HEIF still image may also list MP4 brands, but never the other way round
+    if any(brand in HEIF_BRANDS for brand in brands) and head[8:12] not in (b'isom', b'mp41', b'mp42'):
+        return 'heif'
+    if head[8:12] in QUICKTIME_BRANDS:
+        return 'mov'
+    return 'mp4'
+
+
+def _decompress_head(head):
+    """Return the start of the gzip or xz stream in head, or b''."""
+    try:
+        if head[:2] == b'\x1f\x8b':
+            import zlib
+            return zlib.decompressobj(31).decompress(head, SNIFF_SIZE)
+        if head[:6] == b'\xfd7zXZ\x00':
+            import lzma
+            return lzma.LZMADecompressor().decompress(head, SNIFF_SIZE)
+    except Exception:
+        pass  # Corrupt, or not enough input to produce a header
+    return b''
+
+
+def _is_tar(head):
+    return head[257:262] == b'ustar'
+
+
+def sniff_bytes(head):
+    """Return the format name for a file starting with head, or None."""
+    # First: a TAR header starts with an entry name, which may look like anything
+    if _is_tar(head) or _is_tar(_decompress_head(head)):
+        return 'tar'
+    if head[:4] in (b'PK\x03\x04', b'PK\x05\x06'):
+        return 'zip'
+    if head[:3] == b'\xff\xd8\xff':
+        return 'jpeg'
+    if head[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'png'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if head[:2] == b'BM':
+        return 'bmp'
+    if head[:4] in (b'II*\x00', b'MM\x00*'):
+        return 'tiff'
+    if head[:4] == b'RIFF':
+        if head[8:12] == b'WEBP':
+            return 'webp'
+        if head[8:12] == b'AVI ':
+            return 'avi'
+        return None
+    if head[:3] == b'FLV':
+        return 'flv'
+    if head[:4] == b'\x1a\x45\xdf\xa3':
+        # EBML header; the DocType element says which flavour
+        return 'webm' if b'\x42\x82\x84webm' in head else 'matroska'
+    if head[4:8] == b'ftyp':
+        return _ftyp_format(head)
+    if head[4:8] in (b'moov', b'mdat', b'wide', b'free', b'skip'):
+        return 'mov'  # Old QuickTime files without ftyp
+    return None
+
+
+def sniff(file):
+    """Return the format of file from its leading bytes, or None."""
+    try:
+        with open(file, 'rb') as f:
+            head = f.read(SNIFF_SIZE)
+    except OSError:
+        return None
+    return sniff_bytes(head)
+
+
+def detect(file):
+    """sniff(), falling back to the extension for unrecognised content."""
+    return sniff(file) or EXTENSION_FORMATS.get(extension(file))
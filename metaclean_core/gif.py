@@ -0,0 +1,176 @@
+"""Streaming GIF metadata removal at the block level.
+
+Blocks are copied one at a time, so every frame, the global and local
+palettes, the graphic control extensions (disposal, delay, transparency)
+and the looping block survive untouched and no LZW data is decoded.
+Comment extensions, application extensions other than looping (XMP, ICC
+profiles, vendor data) and anything after the trailer are dropped.
+"""
+
+import os
+
+from .output import create
+
+BUFFER_SIZE = 1 << 20
+
+EXTENSION = 0x21
+IMAGE = 0x2C
+TRAILER = 0x3B
+
+GRAPHIC_CONTROL = 0xF9
+PLAIN_TEXT = 0x01
+APPLICATION = 0xFF
+COMMENT = 0xFE
+
+# Application extensions that control playback rather than describe the file
+LOOPING_APPLICATIONS = {b"NETSCAPE2.0", b"ANIMEXTS1.0"}
+
+
+def is_gif(path):
+    with open(path, "rb") as f:
+        return f.read(6) in (b"GIF87a", b"GIF89a")
+
+
+def _read(f, n):
+    data = f.read(n)
+    if len(data) < n:
+        raise ValueError("Truncated GIF")
+    return data
+
+
+def _color_table_size(packed):
+    return 3 << ((packed & 0x07) + 1) if packed & 0x80 else 0
+
+
+def _sub_blocks(f):
+    """Yield each data sub-block, length byte included, up to the terminator."""
+    while True:
+        length = _read(f, 1)
+        if length == b"\0":
+            yield length
+            return
+        yield length + _read(f, length[0])
+
+
+def _skip_sub_blocks(f):
+    while True:
+        length = _read(f, 1)[0]
+        if not length:
+            return
+        f.seek(length, 1)
+
+
+def iter_blocks(f):
+    """Yield (kind, label) for each block after the header.
+
+    kind is "image", "extension" or "trailer". After an extension is yielded
+    the caller must consume its sub-blocks; after an image, its descriptor,
+    color table and image data sub-blocks.
+    """
+    while True:
+        introducer = f.read(1)
+        if not introducer:
+            raise ValueError("Truncated GIF: missing trailer")
+        if introducer[0] == TRAILER:
+            yield "trailer", None
+            return
+        if introducer[0] == IMAGE:
+            yield "image", None
+        elif introducer[0] == EXTENSION:
+            yield "extension", _read(f, 1)[0]
+        else:
+            raise ValueError(f"Unknown GIF block 0x{introducer[0]:02x}")
+
+
+def _describe(label, first):
+    if label == COMMENT:
+        return "comment"
+    if label == APPLICATION:
+        return f"{first[1:12].decode('latin-1').rstrip()} application block"
+    return f"extension 0x{label:02x}"
+
+
+def _keep_extension(label, first):
+    if label in (GRAPHIC_CONTROL, PLAIN_TEXT):
+        return True
+    if label == APPLICATION:
+        return first[1:12] in LOOPING_APPLICATIONS
+    return False
+
+
+def _read_header(f):
+    header = _read(f, 13)
+    if header[:6] not in (b"GIF87a", b"GIF89a"):
+        raise ValueError("Not a GIF file")
+    return header + _read(f, _color_table_size(header[10]))
+
+
+def _scan(src, dst=None, bufsize=BUFFER_SIZE):
+    """Walk the blocks of src, copying the kept ones to dst if given.
+
+    Returns descriptions of the blocks that are (or would be) dropped.
+    """
+    header = _read_header(src)
+    if dst:
+        dst.write(header)
+    dropped = []
+    for kind, label in iter_blocks(src):
+        if kind == "trailer":
+            if dst:
+                dst.write(bytes([TRAILER]))
+            if src.read(1):
+                dropped.append("data after trailer")
+            return dropped
+
+        if kind == "image":
+            descriptor = _read(src, 9)
+            table = _read(src, _color_table_size(descriptor[8]))
+            min_code_size = _read(src, 1)
+            if dst:
+                dst.write(bytes([IMAGE]) + descriptor + table + min_code_size)
+                _copy_sub_blocks(src, dst, bufsize)
+            else:
+                _skip_sub_blocks(src)
+            continue
+
+        blocks = _sub_blocks(src)
+        first = next(blocks)
+        if _keep_extension(label, first):
+            if dst:
+                dst.write(bytes([EXTENSION, label]) + first)
+            for block in blocks:
+                if dst:
+                    dst.write(block)
+        else:
+            dropped.append(_describe(label, first))
+            for _ in blocks:
+                pass
+
+
+def _copy_sub_blocks(src, dst, bufsize):
+    # Image data is hundreds of 255-byte sub-blocks; batch the writes
+    pending = []
+    size = 0
+    for block in _sub_blocks(src):
+        pending.append(block)
+        size += len(block)
+        if size >= bufsize:
+            dst.write(b"".join(pending))
+            pending.clear()
+            size = 0
+    dst.write(b"".join(pending))
+
+
+def find_metadata(path):
+    """Return descriptions of the blocks strip_gif would remove."""
+    with open(path, "rb") as src:
+        return _scan(src)
+
+
+def strip_gif(src_path, dst_path, bufsize=BUFFER_SIZE):
+    """Write a copy of src_path without metadata blocks to dst_path.
+
+    Returns the number of blocks removed.
+    """
+    with open(src_path, "rb") as src, create(dst_path, os.path.getsize(src_path)) as dst:
+        return len(_scan(src, dst, bufsize))
@@ -0,0 +1,226 @@
+"""In-place metadata removal for HEIF images (HEIC, AVIF).
+
+HEIF stores Exif and XMP as items of the top-level ``meta`` box: an entry in
+``iinf`` names the item type and ``iloc`` says where its bytes are. Each
+metadata item is retyped to an unknown type, which readers ignore, and its
+payload is zero-filled. Nothing moves, so every other item offset stays
+valid and the image data is never read.
+"""
+
+import struct
+
+from .errors import UnsupportedStructure
+from .isobmff import iter_boxes, zero_fill
+
+XMP_CONTENT_TYPE = b"application/rdf+xml"
+# Retyped metadata items get this item type
+NEUTRAL_TYPE = b"free"
+
+
+def _full_box(f, pos, header):
+    f.seek(pos + header)
+    version_flags = f.read(4)
+    if len(version_flags) < 4:
+        raise UnsupportedStructure("Truncated full box header")
+    return version_flags[0], pos + header + 4
+
+
+def _read(f, fmt):
+    size = struct.calcsize(fmt)
+    data = f.read(size)
+    if len(data) < size:
+        raise UnsupportedStructure("Truncated HEIF box")
+    return struct.unpack(fmt, data)
+
+
+def _read_uint(f, size):
+    if size == 0:
+        return 0
+    data = f.read(size)
+    if len(data) < size:
+        raise UnsupportedStructure("Truncated iloc box")
+    return int.from_bytes(data, "big")
+
+
+def _read_cstring(f, end):
+    chars = bytearray()
+    while f.tell() < end:
+        c = f.read(1)
+        if not c or c == b"\0":
+            break
+        chars += c
+    return bytes(chars)
+
+
+def _metadata_items(f, pos, header, size, neutral=False):
+    """Return {item_ID: (name, offset of item_type)} for Exif and XMP items.
+
+    With neutral set, items already retyped by strip_in_place are included.
+    """
+    version, start = _full_box(f, pos, header)
+    f.seek(start)
+    count_size = 2 if version == 0 else 4
+    f.read(count_size)
+    items = {}
+    for infe_pos, infe_header, infe_size, box_type in iter_boxes(f, start + count_size, pos + size):
+        if box_type != b"infe":
+            continue
+        infe_version, data = _full_box(f, infe_pos, infe_header)
+        if infe_version < 2:
+            raise UnsupportedStructure(f"infe version {infe_version}")
+        f.seek(data)
+        item_id = _read(f, ">H" if infe_version == 2 else ">I")[0]
+        f.read(2)  # item_protection_index
+        type_offset = f.tell()
+        item_type = f.read(4)
+        end = infe_pos + infe_size
+        if item_type == b"Exif":
+            items[item_id] = ("Exif", type_offset)
+        elif neutral and item_type == NEUTRAL_TYPE:
+            items[item_id] = ("free", type_offset)
+        elif item_type == b"mime":
+            _read_cstring(f, end)  # item_name
+            if _read_cstring(f, end) == XMP_CONTENT_TYPE:
+                items[item_id] = ("XMP", type_offset)
+    return items
+
+
+def _item_extents(f, pos, header, idat_start):
+    """Return {item_ID: [(file offset, length)]} from an iloc box."""
+    version, start = _full_box(f, pos, header)
+    if version > 2:
+        raise UnsupportedStructure(f"iloc version {version}")
+    f.seek(start)
+    sizes = _read(f, ">H")[0]
+    offset_size, length_size = sizes >> 12, (sizes >> 8) & 0xF
+    base_offset_size, index_size = (sizes >> 4) & 0xF, sizes & 0xF
+    item_count = _read(f, ">H" if version < 2 else ">I")[0]
+
+    extents = {}
+    for _ in range(item_count):
+        item_id = _read(f, ">H" if version < 2 else ">I")[0]
+        construction_method = 0
+        if version >= 1:
+            construction_method = _read(f, ">H")[0] & 0xF
+        f.read(2)  # data_reference_index
+        base_offset = _read_uint(f, base_offset_size)
+        item_extents = []
+        for _ in range(_read(f, ">H")[0]):
+            if version >= 1 and index_size:
+                _read_uint(f, index_size)
+            offset = _read_uint(f, offset_size)
+            length = _read_uint(f, length_size)
+            item_extents.append((construction_method, base_offset + offset, length))
+        extents[item_id] = item_extents
+
+    resolved = {}
+    for item_id, item_extents in extents.items():
+        resolved[item_id] = []
+        for construction_method, offset, length in item_extents:
+            if construction_method == 1:
+                if idat_start is None:
+                    raise UnsupportedStructure("Item stored in a missing idat box")
+                offset += idat_start
+            elif construction_method != 0:
+                raise UnsupportedStructure(f"iloc construction method {construction_method}")
+            resolved[item_id].append((offset, length))
+    return resolved
+
+
+def _locate(f, file_size):
+    """Return the iinf box, the iloc box and the start of idat (or None)."""
+    meta = None
+    for pos, header, size, box_type in iter_boxes(f, 0, file_size):
+        if box_type == b"meta":
+            meta = (pos, header, size)
+            break
+    if meta is None:
+        raise UnsupportedStructure("No meta box found")
+
+    pos, header, size = meta
+    _, start = _full_box(f, pos, header)
+    iinf = iloc = None
+    idat_start = None
+    for box_pos, box_header, box_size, box_type in iter_boxes(f, start, pos + size):
+        if box_type == b"iinf":
+            iinf = (box_pos, box_header, box_size)
+        elif box_type == b"iloc":
+            iloc = (box_pos, box_header)
+        elif box_type == b"idat":
+            idat_start = box_pos + box_header
+    if iinf is None or iloc is None:
+        raise UnsupportedStructure("meta box without iinf or iloc")
+    return iinf, iloc, idat_start
+
+
+def plan_edits(f, file_size):
+    """Return [(item name, item_type offset, [(offset, length)])] for metadata items."""
+    iinf, iloc, idat_start = _locate(f, file_size)
+    items = _metadata_items(f, *iinf)
+    if not items:
+        return []
+    extents = _item_extents(f, *iloc, idat_start)
+    plan = []
+    for item_id, (name, type_offset) in items.items():
+        item_extents = extents.get(item_id, [])
+        for offset, length in item_extents:
+            if length == 0 or offset + length > file_size:
+                raise UnsupportedStructure(f"Unbounded extent for {name} item")
+        plan.append((name, type_offset, item_extents))
+    return plan
+
+
+def find_metadata(path):
+    """Return descriptions of the metadata strip_in_place would remove."""
+    with open(path, "rb") as f:
+        f.seek(0, 2)
+        return [f"{name} item" for name, _, _ in plan_edits(f, f.tell())]
+
+
+def data_digest(path, bufsize=1 << 20):
+    """Return a SHA-256 of the data of every item except Exif and XMP.
+
+    Items strip_in_place retyped are skipped as well, so the digest is the
+    same before and after cleaning.
+    """
+    import hashlib
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        f.seek(0, 2)
+        file_size = f.tell()
+        iinf, iloc, idat_start = _locate(f, file_size)
+        metadata = _metadata_items(f, *iinf, neutral=True)
+        extents = _item_extents(f, *iloc, idat_start)
+        for item_id in sorted(extents):
+            if item_id in metadata:
+                continue
+            digest.update(item_id.to_bytes(4, "big"))
+            for offset, length in extents[item_id]:
+                f.seek(offset)
+                remaining = length or file_size - offset  # 0 means "to the end of the file"
+                while remaining > 0:
+                    data = f.read(min(bufsize, remaining))
+                    if not data:
+                        break
+                    digest.update(data)
+                    remaining -= len(data)
+    return digest.hexdigest()
+
+
+def strip_in_place(path):
+    """Neutralise Exif and XMP items in path without rewriting the file.
+
+    Returns the number of items removed. Raises UnsupportedStructure, before
+    anything is written, if the layout is not understood.
+    """
+    with open(path, "r+b") as f:
+        f.seek(0, 2)
+        plan = plan_edits(f, f.tell())
+        for _, type_offset, item_extents in plan:
+            # Retype first so an interrupted run never leaves a corrupt Exif item
+            f.seek(type_offset)
+            f.write(NEUTRAL_TYPE)
+            for offset, length in item_extents:
+                zero_fill(f, offset, length)
+    return len(plan)
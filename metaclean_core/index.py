@@ -0,0 +1,118 @@
+"""Persistent record of files that are already clean.
+
+Each cleaned file is stored with its size, mtime_ns, inode and the cleaner
+version that produced it. On the next run a single ``os.stat`` is enough to
+tell whether the file is unchanged; any modification (or a newer cleaner)
+invalidates the entry automatically. An optional content hash lets files
+whose timestamps changed but whose bytes did not (touch, copies) be skipped
+too.
+"""
+
+import hashlib
+import os
+import sqlite3
+import sys
+import time
+
+from .cleaner import CLEANER_VERSION
+
+HASH_CHUNK = 1 << 20
+COMMIT_EVERY = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cleaned (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    sha256 TEXT,
+    version INTEGER NOT NULL,
+    cleaned_at REAL NOT NULL
+)
+"""
+
+
+def default_index_path():
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    elif sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "metaclean", "index.sqlite")
+
+
+def file_hash(file):
+    digest = hashlib.sha256()
+    with open(file, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class CleanIndex:
+    def __init__(self, path=None, hash_content=False):
+        self.path = path or default_index_path()
+        self.hash_content = hash_content
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # Used by one thread at a time, but not necessarily the one that opened it
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(SCHEMA)
+        self.pending = 0
+
+    def _key(self, file):
+        return os.path.realpath(file)
+
+    def is_clean(self, file):
+        """Return True if file is unchanged since it was last cleaned."""
+        try:
+            st = os.stat(file)
+        except OSError:
+            return False
+        key = self._key(file)
+        row = self.db.execute(
+            "SELECT size, mtime_ns, inode, sha256 FROM cleaned WHERE path = ? AND version = ?",
+            (key, CLEANER_VERSION),
+        ).fetchone()
+        if row is None:
+            return False
+        size, mtime_ns, inode, sha256 = row
+        if (size, mtime_ns, inode) == (st.st_size, st.st_mtime_ns, st.st_ino):
+            return True
+        if self.hash_content and sha256 and size == st.st_size and file_hash(file) == sha256:
+            self._store(key, st, sha256)  # Same bytes, refresh the stat fast path
+            return True
+        return False
+
+    def mark_clean(self, file):
+        st = os.stat(file)
+        sha256 = file_hash(file) if self.hash_content else None
+        self._store(self._key(file), st, sha256)
+
+    def forget(self, file):
+        self.db.execute("DELETE FROM cleaned WHERE path = ?", (self._key(file),))
+        self._committed()
+
+    def _store(self, key, st, sha256):
+        self.db.execute(
+            "INSERT OR REPLACE INTO cleaned VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, st.st_size, st.st_mtime_ns, st.st_ino, sha256, CLEANER_VERSION, time.time()),
+        )
+        self._committed()
+
+    def _committed(self):
+        # Commit in batches; a crash loses at most a few entries, which are
+        # simply cleaned again next time
+        self.pending += 1
+        if self.pending >= COMMIT_EVERY:
+            self.flush()
+
+    def flush(self):
+        self.db.commit()
+        self.pending = 0
+
+    def close(self):
+        self.flush()
+        self.db.close()
@@ -0,0 +1,157 @@
+"""Optional timing spans and counters for the cleaning pipeline.
+
+Disabled by default: span() then returns a shared no-op context manager and
+count() returns immediately, so instrumented code pays one global lookup and
+a function call.
+
+When enabled, every process (including pool workers spawned afterwards,
+which inherit the spool location through the environment) appends events
+to its own JSON-lines file in a spool directory. finish() merges them into
+a single JSON-lines or Chrome trace-event file (load it in chrome://tracing
+or https://ui.perfetto.dev).
+"""
+
+import contextlib
+import glob
+import json
+import os
+import shutil
+import threading
+import time
+
+SPOOL_ENV = "METACLEAN_TRACE_SPOOL"
+
+_enabled = False
+_spool = None
+_out = None
+_lock = threading.Lock()
+_NULL_SPAN = contextlib.nullcontext()
+
+
+def enabled():
+    return _enabled
+
+
+def _now_us():
+    return time.time_ns() // 1000
+
+
+def _write(event):
+    line = json.dumps(event) + "\n"
+    with _lock:
+        if _out:
+            _out.write(line)
+            _out.flush()  # Workers can be torn down without running atexit
+
+
+def _open_spool(spool):
+    global _enabled, _spool, _out
+    _spool = spool
+    _out = open(os.path.join(spool, f"{os.getpid()}.jsonl"), "a", encoding="utf-8")
+    _enabled = True
+
+
+class _Span:
+    __slots__ = ("name", "args", "start")
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = _now_us()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = _now_us()
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        _write({"type": "span", "name": self.name, "ts": self.start, "dur": end - self.start,
+                "pid": os.getpid(), "tid": threading.get_ident(), "args": self.args})
+        return False
+
+
+def span(name, **args):
+    """Time a block: ``with span("ffmpeg", file=path): ...``"""
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(name, args)
+
+
+def count(name, value=1, **args):
+    """Record a counter sample, such as bytes read or a spawn latency."""
+    if not _enabled:
+        return
+    _write({"type": "counter", "name": name, "value": value, "ts": _now_us(),
+            "pid": os.getpid(), "tid": threading.get_ident(), "args": args})
+
+
+def start():
+    """Enable instrumentation in this process and in processes it spawns."""
+    import tempfile
+
+    spool = tempfile.mkdtemp(prefix="metaclean-trace-")
+    os.environ[SPOOL_ENV] = spool
+    _open_spool(spool)
+
+
+def _events(spool):
+    for path in sorted(glob.glob(os.path.join(spool, "*.jsonl"))):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _chrome_event(event):
+    if event["type"] == "span":
+        return {"name": event["name"], "ph": "X", "ts": event["ts"], "dur": event["dur"],
+                "pid": event["pid"], "tid": event["tid"], "args": event["args"]}
+    return {"name": event["name"], "ph": "C", "ts": event["ts"], "pid": event["pid"],
+            "tid": event["tid"], "args": {event["name"]: event["value"]}}
+
+
+def summarize(events):
+    """Return {span name: (count, total seconds)} sorted by total time."""
+    totals = {}
+    for event in events:
+        if event["type"] == "span":
+            n, total = totals.get(event["name"], (0, 0))
+            totals[event["name"]] = (n + 1, total + event["dur"] / 1e6)
+    return dict(sorted(totals.items(), key=lambda item: -item[1][1]))
+
+
+def finish(path=None, trace_format="jsonl"):
+    """Disable instrumentation, merge all processes' events and export them.
+
+    trace_format is "jsonl" (one event per line) or "chrome" (trace-event
+    JSON). Returns the merged events, sorted by timestamp.
+    """
+    global _enabled, _spool, _out
+    if _spool is None:
+        return []
+    with _lock:
+        _enabled = False
+        if _out:
+            _out.close()
+            _out = None
+    os.environ.pop(SPOOL_ENV, None)
+
+    events = sorted(_events(_spool), key=lambda event: event["ts"])
+    shutil.rmtree(_spool, ignore_errors=True)
+    _spool = None
+
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            if trace_format == "chrome":
+                json.dump({"traceEvents": [_chrome_event(e) for e in events],
+                           "displayTimeUnit": "ms"}, f)
+            else:
+                for event in events:
+                    f.write(json.dumps(event) + "\n")
+    return events
+
+
+# Pool workers spawned while tracing is active pick it up on import
+if os.environ.get(SPOOL_ENV) and os.path.isdir(os.environ[SPOOL_ENV]):
+    _open_spool(os.environ[SPOOL_ENV])
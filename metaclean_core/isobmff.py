@@ -0,0 +1,207 @@
+"""In-place metadata removal for ISO base media files (MP4, MOV).
+
+Metadata boxes are turned into zero-filled ``free`` boxes of the same size,
+the creation/modification times in the movie, track and media headers are
+zeroed and so is the encoder name in each video sample description. Nothing
+moves, so chunk offsets stay valid and ``mdat`` is never read or copied:
+cleaning costs a few kilobytes of I/O regardless of file size.
+
+QuickTime chapters are a text track referenced through ``tref/chap``, whose
+samples live in ``mdat``, and timecode, timed metadata (GoPro GPS, Apple
+mebx) and other data tracks keep theirs there too. Files with any of them
+raise UnsupportedStructure so they are remuxed instead, which keeps only
+the video, audio and subtitle streams (see cleaner.remux_stream).
+"""
+
+import struct
+
+from .errors import UnsupportedStructure
+
+ZERO_BLOCK = bytes(1 << 16)
+
+# Boxes whose children are walked looking for metadata
+CONTAINERS = {b"moov", b"trak", b"mdia", b"minf", b"stbl"}
+METADATA_BOXES = {b"udta", b"meta"}
+HEADER_BOXES = {b"mvhd", b"tkhd", b"mdhd"}
+XMP_UUID = bytes.fromhex("be7acfcb97a942e89c71999491e3afac")
+# Handlers of the tracks the remux keeps; any other track is metadata
+MEDIA_HANDLERS = {b"vide", b"soun", b"sbtl", b"subt", b"text"}
+
+# VisualSampleEntry: 8 bytes of SampleEntry and 34 of sizes and resolution,
+# then a 32-byte Pascal string naming the encoder ("Lavc mpeg4"...)
+COMPRESSOR_NAME_OFFSET = 42
+COMPRESSOR_NAME_SIZE = 32
+
+
+def iter_boxes(f, start, end):
+    """Yield (offset, header_size, size, type) for each box in [start, end)."""
+    pos = start
+    while pos < end:
+        if end - pos < 8:
+            raise UnsupportedStructure(f"Trailing bytes at offset {pos}")
+        f.seek(pos)
+        size, box_type = struct.unpack(">I4s", f.read(8))
+        header = 8
+        if size == 1:
+            largesize = f.read(8)
+            if len(largesize) < 8:
+                raise UnsupportedStructure(f"Truncated box header at offset {pos}")
+            size = struct.unpack(">Q", largesize)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos  # Box extends to the end of its parent
+        if size < header or pos + size > end:
+            raise UnsupportedStructure(f"Invalid size for box {box_type!r} at offset {pos}")
+        yield pos, header, size, box_type
+        pos += size
+
+
+def _handler_type(f, start, end):
+    """Return the handler type ("vide", "soun", "text"...) of an mdia box."""
+    for pos, header, size, box_type in iter_boxes(f, start, end):
+        if box_type == b"hdlr" and size - header >= 12:
+            f.seek(pos + header + 8)  # version/flags, pre_defined
+            return f.read(4)
+    return None
+
+
+def _plan_sample_descriptions(f, start, end, plan):
+    # Full box header and entry count, then one box per sample entry
+    for pos, header, size, _ in iter_boxes(f, start + 8, end):
+        if size - header >= COMPRESSOR_NAME_OFFSET + COMPRESSOR_NAME_SIZE:
+            plan.append(("zero", pos + header + COMPRESSOR_NAME_OFFSET, COMPRESSOR_NAME_SIZE,
+                         "stsd compressor name"))
+
+
+def _plan_container(f, start, end, plan, handler=None):
+    for pos, header, size, box_type in iter_boxes(f, start, end):
+        if box_type in METADATA_BOXES:
+            plan.append(("free", pos, header, size, box_type))
+        elif box_type in HEADER_BOXES:
+            f.seek(pos + header)
+            version = f.read(1)
+            if not version:
+                raise UnsupportedStructure(f"Truncated {box_type.decode()} box")
+            # creation_time and modification_time follow version/flags
+            width = 16 if version[0] == 1 else 8
+            if size - header < 4 + width:
+                raise UnsupportedStructure(f"Short {box_type.decode()} box")
+            plan.append(("zero", pos + header + 4, width, f"{box_type.decode()} timestamps"))
+        elif box_type == b"tref":
+            for _, _, _, reference in iter_boxes(f, pos + header, pos + size):
+                if reference == b"chap":
+                    plan.append(("remux", "chapter track"))
+        elif box_type == b"stsd" and handler == b"vide":
+            _plan_sample_descriptions(f, pos + header, pos + size, plan)
+        elif box_type == b"mdia":
+            handler = _handler_type(f, pos + header, pos + size)
+            if handler not in MEDIA_HANDLERS:
+                name = handler.decode("latin-1").strip() if handler else "unknown"
+                plan.append(("remux", f"{name} track"))
+            _plan_container(f, pos + header, pos + size, plan, handler)
+        elif box_type in CONTAINERS:
+            _plan_container(f, pos + header, pos + size, plan, handler)
+
+
+def plan_edits(f, file_size):
+    """Return the list of edits needed to clean an open file, without writing.
+
+    A ("remux", description) edit means the metadata cannot be removed in
+    place.
+    """
+    plan = []
+    found_moov = False
+    for pos, header, size, box_type in iter_boxes(f, 0, file_size):
+        if box_type == b"moov":
+            found_moov = True
+            _plan_container(f, pos + header, pos + size, plan)
+        elif box_type in METADATA_BOXES:
+            plan.append(("free", pos, header, size, box_type))
+        elif box_type == b"uuid":
+            f.seek(pos + header)
+            if f.read(16) == XMP_UUID:
+                plan.append(("free", pos, header, size, box_type))
+    if not found_moov:
+        raise UnsupportedStructure("No moov box found")
+    return plan
+
+
+def _has_content(f, start, end):
+    """Whether a udta/meta box holds more than handlers and empty item lists."""
+    for pos, header, size, box_type in iter_boxes(f, start, end):
+        if box_type == b"meta":
+            if _has_content(f, pos + header + 4, pos + size):  # Full box: skip version/flags
+                return True
+        elif box_type != b"hdlr" and not (box_type == b"ilst" and size == header):
+            return True
+    return False
+
+
+def _is_empty(f, pos, header, size, box_type):
+    # ffmpeg's MP4 muxer always writes udta/meta with an empty ilst
+    start = pos + header + (4 if box_type == b"meta" else 0)
+    try:
+        return not _has_content(f, start, pos + size)
+    except UnsupportedStructure:
+        return False  # QuickTime-style meta without version/flags, or damaged
+
+
+def find_metadata(path):
+    """Return descriptions of the metadata strip_in_place would remove.
+
+    Each description is listed once, however many tracks it was found in.
+    """
+    found = []
+    with open(path, "rb") as f:
+        f.seek(0, 2)
+        for edit in plan_edits(f, f.tell()):
+            if edit[0] == "free":
+                if _is_empty(f, *edit[1:]):
+                    continue
+                description = f"{edit[4].decode('latin-1')} box"
+            elif edit[0] == "remux":
+                description = edit[1]
+            else:
+                _, offset, length, description = edit
+                f.seek(offset)
+                if not any(f.read(length)):
+                    continue
+            if description not in found:
+                found.append(description)
+    return found
+
+
+def zero_fill(f, offset, length):
+    f.seek(offset)
+    while length:
+        n = min(length, len(ZERO_BLOCK))
+        f.write(ZERO_BLOCK[:n])
+        length -= n
+
+
+def strip_in_place(path):
+    """Neutralise metadata in path without rewriting the file.
+
+    Returns the number of metadata boxes removed. Raises UnsupportedStructure,
+    before anything is written, if the file needs a full remux instead.
+    """
+    with open(path, "r+b") as f:
+        f.seek(0, 2)
+        plan = plan_edits(f, f.tell())
+        for edit in plan:
+            if edit[0] == "remux":
+                raise UnsupportedStructure(f"{edit[1].capitalize()} needs a remux")
+
+        removed = 0
+        for edit in plan:
+            if edit[0] == "free":
+                _, pos, header, size, _ = edit
+                # Retype first so an interrupted run still leaves a valid file
+                f.seek(pos + 4)
+                f.write(b"free")
+                zero_fill(f, pos + header, size - header)
+                removed += 1
+            else:
+                _, offset, length, _ = edit
+                zero_fill(f, offset, length)
+    return removed
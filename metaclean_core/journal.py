@@ -0,0 +1,181 @@
+"""Append-only journal of a batch, so an interrupted run can be resumed.
+
+Every state change (queued, started, done, failed) is appended as one JSON
+line and flushed immediately, so a killed process loses nothing; the file is
+fsynced at most every SYNC_INTERVAL_S so a power cut loses at most that much.
+The last state recorded for a file wins. A torn final line from a crash is
+ignored when the journal is read back.
+
+Resuming skips files that are done, removes the staged file an
+interrupted file may have left behind and cleans it again, and keeps the
+failures so they can be reported. Where cleaned files go (see
+output.Output) is recorded too, so a resumed run with an output directory
+never falls back to replacing the originals.
+"""
+
+import json
+import os
+import threading
+import time
+
+from .index import default_index_path
+from .output import Output
+
+QUEUED = "queued"
+STARTED = "started"
+DONE = "done"
+FAILED = "failed"
+
+SYNC_INTERVAL_S = 1.0
+
+
+def default_journal_path():
+    return os.path.join(os.path.dirname(default_index_path()), "journal.jsonl")
+
+
+def _read(path):
+    states = {}
+    output = None
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+                if "output" in entry:
+                    output = entry["output"]
+                    continue
+                states[entry["file"]] = (entry["state"], entry.get("error"))
+            except (ValueError, KeyError, TypeError):
+                continue  # Torn write from a crash
+    return states, output
+
+
+def read_states(path):
+    """Return {file: (state, error)} from a journal, in first-queued order."""
+    return _read(path)[0]
+
+
+def pending_files(path=None):
+    """Return the files a journal still lists as queued or started."""
+    try:
+        states = read_states(path or default_journal_path())
+    except OSError:
+        return []
+    return [file for file, (state, _) in states.items() if state in (QUEUED, STARTED)]
+
+
+class Journal:
+    """Records per-file batch state in an append-only JSON-lines file.
+
+    With resume set, an existing journal is read back and compacted to one
+    line per file, and the output it recorded replaces the one given;
+    otherwise any previous journal at path is replaced. Methods may be
+    called from any thread.
+    """
+
+    def __init__(self, path=None, resume=False, output=None):
+        self.path = path or default_journal_path()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.states = {}
+        self.output = output or Output()
+        if resume:
+            self.states, settings = _read(self.path)
+            if settings is not None:
+                self.output = Output(**settings)
+
+        # Start from a compact file; also drops a torn last line
+        temp_path = f"{self.path}.temp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            if not self.output.in_place:
+                f.write(json.dumps({"output": vars(self.output)}) + "\n")
+            for file, (state, error) in self.states.items():
+                f.write(self._line(file, state, error))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+
+        self.out = open(self.path, "a", encoding="utf-8")
+        self.lock = threading.Lock()
+        self.last_sync = time.monotonic()
+
+    @staticmethod
+    def _line(file, state, error=None):
+        entry = {"file": file, "state": state}
+        if error is not None:
+            entry["error"] = error
+        return json.dumps(entry) + "\n"
+
+    def _append(self, lines):
+        with self.lock:
+            self.out.write("".join(lines))
+            self.out.flush()
+            now = time.monotonic()
+            if now - self.last_sync >= SYNC_INTERVAL_S:
+                os.fsync(self.out.fileno())
+                self.last_sync = now
+
+    def _set(self, file, state, error=None):
+        self.states[file] = (state, error)
+        self._append([self._line(file, state, error)])
+
+    def queued(self, files):
+        """Record files as queued, leaving files the journal already tracks."""
+        lines = []
+        for file in files:
+            if file not in self.states:
+                self.states[file] = (QUEUED, None)
+                lines.append(self._line(file, QUEUED))
+        if lines:
+            self._append(lines)
+
+    def started(self, file):
+        self._set(file, STARTED)
+
+    def done(self, file):
+        self._set(file, DONE)
+
+    def failed(self, file, error):
+        self._set(file, FAILED, str(error))
+
+    def counts(self):
+        counts = {QUEUED: 0, STARTED: 0, DONE: 0, FAILED: 0}
+        for state, _ in self.states.values():
+            counts[state] += 1
+        return counts
+
+    def failures(self):
+        return {file: error for file, (state, error) in self.states.items() if state == FAILED}
+
+    def prepare_resume(self):
+        """Return the files still to clean, after removing stranded temp files.
+
+        Files that were started but never finished may have left a partial
+        staged output behind, while the original is untouched until the
+        final rename, so they are simply cleaned again.
+        """
+        pending = []
+        for file, (state, _) in self.states.items():
+            if state == STARTED:
+                temp_file = self.output.staging_path(file)
+                if os.path.exists(temp_file):
+                    os.remove(temp_file)
+            if state in (QUEUED, STARTED):
+                pending.append(file)
+        return pending
+
+    def sync(self):
+        with self.lock:
+            self.out.flush()
+            os.fsync(self.out.fileno())
+            self.last_sync = time.monotonic()
+
+    def close(self, remove_finished=False):
+        """Close the journal; with remove_finished, delete it if nothing is left to resume.
+
+        A finished journal only lists the paths that were cleaned, which
+        is not worth keeping around unless it was asked for.
+        """
+        self.sync()
+        self.out.close()
+        counts = self.counts()
+        if remove_finished and not counts[QUEUED] and not counts[STARTED]:
+            os.remove(self.path)
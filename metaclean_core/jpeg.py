@@ -0,0 +1,182 @@
+"""Lossless JPEG metadata removal at the marker-segment level.
+
+The file is streamed segment by segment: metadata segments are dropped and
+everything else, including the entropy-coded scan data, is copied verbatim.
+No pixels are decoded, so the output is bit-identical apart from the removed
+segments.
+"""
+
+import os
+
+from .output import create
+
+BUFFER_SIZE = 1 << 20
+
+SOI = 0xD8
+EOI = 0xD9
+SOS = 0xDA
+COM = 0xFE
+TEM = 0x01
+
+
+def is_jpeg(path):
+    with open(path, "rb") as f:
+        return f.read(3) == b"\xff\xd8\xff"
+
+
+def keep_segment(marker, payload, keep_icc=False):
+    """Return True if a header segment carries no identifying metadata."""
+    if marker == COM:
+        return False
+    if 0xE0 <= marker <= 0xEF:
+        # Only whitelisted APPn segments survive; everything else (EXIF, XMP,
+        # IPTC/Photoshop, MPF, FlashPix, JUMBF, vendor blocks) is metadata.
+        if marker == 0xE0:
+            return payload.startswith(b"JFIF\x00")
+        if marker == 0xEE:
+            return payload.startswith(b"Adobe")  # Needed for CMYK/YCCK decoding
+        if marker == 0xE2:
+            return keep_icc and payload.startswith(b"ICC_PROFILE\x00")
+        return False
+    return True
+
+
+def describe_segment(marker, payload):
+    if marker == COM:
+        return "COM comment"
+    name = f"APP{marker - 0xE0}"
+    ident = payload.split(b"\x00", 1)[0][:32]
+    if ident and all(32 <= c < 127 for c in ident):
+        return f"{name} {ident.decode('ascii')}"
+    return name
+
+
+class _Reader:
+    """Buffered reader that can scan entropy-coded data for the next marker."""
+
+    def __init__(self, f, bufsize):
+        self.f = f
+        self.bufsize = bufsize
+        self.buf = b""
+        self.pos = 0
+
+    def _fill(self, n):
+        if len(self.buf) - self.pos >= n:
+            return True
+        self.buf = self.buf[self.pos:]
+        self.pos = 0
+        while len(self.buf) < n:
+            chunk = self.f.read(max(self.bufsize, n - len(self.buf)))
+            if not chunk:
+                return False
+            self.buf += chunk
+        return True
+
+    def read(self, n):
+        if not self._fill(n):
+            raise ValueError("Truncated JPEG data")
+        data = self.buf[self.pos:self.pos + n]
+        self.pos += n
+        return data
+
+    def next_marker(self):
+        if self.read(1) != b"\xff":
+            raise ValueError("Corrupt JPEG: expected marker")
+        marker = self.read(1)[0]
+        while marker == 0xFF:  # Fill bytes
+            marker = self.read(1)[0]
+        return marker
+
+    def copy_scan(self, dst):
+        """Copy scan data to dst and return the marker that terminates it."""
+        while True:
+            if not self._fill(2):
+                raise ValueError("Truncated JPEG scan data")
+            buf = self.buf
+            i = buf.find(b"\xff", self.pos)
+            while i != -1 and i + 1 < len(buf):
+                nxt = buf[i + 1]
+                if nxt == 0x00 or 0xD0 <= nxt <= 0xD7:
+                    # Stuffed byte or restart marker: part of the scan
+                    i = buf.find(b"\xff", i + 2)
+                elif nxt == 0xFF:
+                    i += 1
+                else:
+                    dst.write(buf[self.pos:i])
+                    self.pos = i + 2
+                    return nxt
+            # Keep a trailing 0xFF in the buffer so it is paired with the next read
+            end = len(buf) if i == -1 else i
+            dst.write(buf[self.pos:end])
+            self.pos = end
+
+
+def find_metadata(path, keep_icc=False, bufsize=1 << 16):
+    """Return descriptions of the segments strip_jpeg would remove.
+
+    Only the headers before the first scan are read, plus the last two bytes
+    to detect data trailing the image.
+    """
+    found = []
+    with open(path, "rb") as src:
+        reader = _Reader(src, bufsize)
+        if reader.read(2) != b"\xff\xd8":
+            raise ValueError("Not a JPEG file")
+        marker = reader.next_marker()
+        while marker not in (SOS, EOI):
+            if marker == TEM or 0xD0 <= marker <= 0xD7:
+                marker = reader.next_marker()
+                continue
+            length = int.from_bytes(reader.read(2), "big")
+            if length < 2:
+                raise ValueError(f"Corrupt JPEG segment length for marker 0x{marker:02X}")
+            payload = reader.read(length - 2)
+            if not keep_segment(marker, payload, keep_icc):
+                found.append(describe_segment(marker, payload))
+            marker = reader.next_marker()
+
+        src.seek(-2, 2)
+        if src.read(2) != b"\xff\xd9":
+            found.append("data after end of image")
+    return found
+
+
+def strip_jpeg(src_path, dst_path, keep_icc=False, bufsize=BUFFER_SIZE):
+    """Write a copy of src_path without metadata segments to dst_path.
+
+    Returns the number of segments removed. Data after EOI (maker trailers,
+    MPF secondary images) is dropped as well.
+    """
+    removed = 0
+    with open(src_path, "rb") as src, create(dst_path, os.path.getsize(src_path)) as dst:
+        reader = _Reader(src, bufsize)
+        if reader.read(2) != b"\xff\xd8":
+            raise ValueError("Not a JPEG file")
+        dst.write(b"\xff\xd8")
+
+        marker = reader.next_marker()
+        while marker != EOI:
+            if marker == TEM or 0xD0 <= marker <= 0xD7:
+                dst.write(bytes((0xFF, marker)))
+                marker = reader.next_marker()
+                continue
+
+            length_bytes = reader.read(2)
+            length = int.from_bytes(length_bytes, "big")
+            if length < 2:
+                raise ValueError(f"Corrupt JPEG segment length for marker 0x{marker:02X}")
+            payload = reader.read(length - 2)
+
+            if keep_segment(marker, payload, keep_icc):
+                dst.write(bytes((0xFF, marker)) + length_bytes)
+                dst.write(payload)
+            else:
+                removed += 1
+
+            if marker == SOS:
+                marker = reader.copy_scan(dst)
+            else:
+                marker = reader.next_marker()
+
+        dst.write(b"\xff\xd9")
+    return removed
@@ -0,0 +1,236 @@
+"""Where cleaned files are written, and how they reach the disk.
+
+Cleaners write a staged file which is then renamed over its target, so a
+crash never leaves a half-written file in place of the original. Staging
+only happens on the target's own filesystem, where the rename is atomic.
+
+Unchanged data is copied in the kernel: whole files are reflinked (FICLONE)
+on filesystems that share extents (Btrfs, XFS, bcachefs) and otherwise
+copied with copy_file_range, which never passes the bytes through Python.
+Larger outputs are preallocated so they are laid out contiguously.
+"""
+
+import contextlib
+import errno
+import os
+import stat
+
+from . import instrument
+
+BUFFER_SIZE = 1 << 20
+# Smaller outputs and ranges are not worth the extra syscalls
+PREALLOCATE_MIN = 1 << 20
+COPY_IN_KERNEL_MIN = 64 << 10
+# _IOW(0x94, 9, int): clone a whole file (Linux)
+FICLONE = 0x40049409
+
+DURABILITY_MODES = ("none", "file", "dir")
+
+# errnos meaning "this kernel or filesystem pair cannot do that", not a real I/O error
+_UNSUPPORTED = {errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTTY,
+                errno.EINVAL, errno.EBADF, errno.EPERM}
+
+
+def preallocate(f, size):
+    if size < PREALLOCATE_MIN or not hasattr(os, "posix_fallocate"):
+        return
+    try:
+        os.posix_fallocate(f.fileno(), 0, size)
+    except OSError as e:
+        if e.errno not in _UNSUPPORTED:
+            raise
+
+
+@contextlib.contextmanager
+def create(path, size_hint=0):
+    """Open path for writing with size_hint bytes preallocated.
+
+    The file is truncated at the final write position on exit, so a
+    generous hint (usually the input size) costs nothing.
+    """
+    with open(path, "wb") as f:
+        preallocate(f, size_hint)
+        yield f
+        f.truncate()
+
+
+def copy_range(src, dst, offset, length, bufsize=BUFFER_SIZE):
+    """Append length bytes of src, starting at offset, to dst.
+
+    Both are open binary files. copy_file_range is used where the kernel
+    supports it, with a buffered copy for whatever it could not do. Raises
+    ValueError if src ends early.
+    """
+    if length >= COPY_IN_KERNEL_MIN and hasattr(os, "copy_file_range"):
+        dst.flush()
+        pos = dst.tell()
+        copied = 0
+        try:
+            while copied < length:
+                n = os.copy_file_range(src.fileno(), dst.fileno(), length - copied,
+                                       offset + copied, pos + copied)
+                if not n:
+                    raise ValueError("Unexpected end of file")
+                copied += n
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED:
+                raise
+        dst.seek(pos + copied)
+        offset += copied
+        length -= copied
+
+    src.seek(offset)
+    while length:
+        data = src.read(min(bufsize, length))
+        if not data:
+            raise ValueError("Unexpected end of file")
+        dst.write(data)
+        length -= len(data)
+
+
+def _reflink(src, dst):
+    try:
+        import fcntl
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return True
+    except (ImportError, OSError):
+        return False
+
+
+def copy_file(src_path, dst_path):
+    """Copy a whole file, sharing its extents when the filesystem allows it."""
+    with open(src_path, "rb") as src, open(dst_path, "wb") as dst:
+        if _reflink(src, dst):
+            instrument.count("reflinked_files", 1, file=src_path)
+            return
+        size = os.fstat(src.fileno()).st_size
+        preallocate(dst, size)
+        copy_range(src, dst, 0, size)
+        dst.truncate()
+
+
+def fsync_path(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def fsync_dir(path):
+    # Windows cannot open a directory, and NTFS journals the rename itself
+    if os.name != "nt":
+        fsync_path(path)
+
+
+def _device(path):
+    return os.stat(path).st_dev
+
+
+class Output:
+    """Decides where the cleaned version of a file goes and commits it.
+
+    output_dir None (the default) replaces each original. Otherwise cleaned
+    files are written below output_dir and originals are only read: a file
+    under one of roots keeps its path relative to that root, any other file
+    keeps just its name.
+
+    staging_dir holds files while they are written. It is only used for
+    targets on the same filesystem, otherwise staged files are written next
+    to their target as ``<target>.temp``.
+
+    durability is "none", "file" (fsync each file before it is renamed into
+    place) or "dir" (also fsync its directory, so the rename itself
+    survives a power cut).
+
+    With verify set, every staged file is compared with its original (see
+    verify.verify_file) before it is committed, so originals are never
+    edited in place.
+
+    Instances are passed to worker processes, so keep them picklable.
+    """
+
+    def __init__(self, output_dir=None, roots=(), staging_dir=None, durability="none", verify=False):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability mode {durability!r}")
+        self.output_dir = os.path.abspath(output_dir) if output_dir else None
+        self.roots = sorted((os.path.abspath(root) for root in roots if os.path.isdir(root)),
+                            key=len, reverse=True)
+        self.staging_dir = os.path.abspath(staging_dir) if staging_dir else None
+        self.durability = durability
+        self.verify = verify
+
+    @property
+    def in_place(self):
+        return self.output_dir is None
+
+    @property
+    def edits_originals(self):
+        """Whether in-place engines may modify the original file directly."""
+        return self.in_place and not self.verify
+
+    def target(self, file):
+        """Return the path the cleaned version of file is written to."""
+        if self.in_place:
+            return file
+        file = os.path.abspath(file)
+        for root in self.roots:
+            if file.startswith(root + os.sep):
+                return os.path.join(self.output_dir, os.path.relpath(file, root))
+        return os.path.join(self.output_dir, os.path.basename(file))
+
+    def staging_path(self, file):
+        """Return the temporary path the cleaned version of file is staged at."""
+        target = self.target(file)
+        if self.staging_dir and self._same_filesystem(target):
+            import hashlib
+
+            digest = hashlib.sha1(os.path.abspath(target).encode("utf-8", "surrogateescape")).hexdigest()
+            return os.path.join(self.staging_dir, f"{digest[:16]}-{os.path.basename(target)}.temp")
+        return f"{target}.temp"
+
+    def _same_filesystem(self, target):
+        try:
+            return _device(self.staging_dir) == _device(os.path.dirname(target) or ".")
+        except OSError:
+            return False
+
+    def prepare(self, file):
+        """Create the directories the staged and cleaned files go in."""
+        if not self.in_place:
+            os.makedirs(os.path.dirname(self.target(file)), exist_ok=True)
+        if self.staging_dir:
+            os.makedirs(self.staging_dir, exist_ok=True)
+
+    def commit(self, file, temp_file):
+        """Move the staged temp_file into place as the cleaned file."""
+        if not os.path.exists(temp_file) or os.path.getsize(temp_file) == 0:
+            raise Exception("Failed to create valid output file")
+
+        if instrument.enabled():
+            instrument.count('bytes_out', os.path.getsize(temp_file), file=file)
+        target = self.target(file)
+        with instrument.span('replace', file=file):
+            os.chmod(temp_file, stat.S_IMODE(os.stat(file).st_mode))
+            if self.durability != "none":
+                fsync_path(temp_file)
+            os.replace(temp_file, target)
+            if self.durability == "dir":
+                fsync_dir(os.path.dirname(os.path.abspath(target)))
+
+    def edited(self, file):
+        """Make an in-place edit of file as durable as a committed one."""
+        if self.durability != "none":
+            fsync_path(file)
+
+    def copy_unchanged(self, file):
+        """Write an already clean file to its target, which is a no-op in place."""
+        if self.in_place:
+            return
+        self.prepare(file)
+        temp_file = self.staging_path(file)
+        copy_file(file, temp_file)
+        self.commit(file, temp_file)
+
+
+IN_PLACE = Output()
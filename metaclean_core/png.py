@@ -0,0 +1,105 @@
+"""Streaming PNG metadata removal at the chunk level.
+
+Chunks are copied through a fixed-size buffer, so memory use does not depend
+on the image size and no pixel data is decompressed.
+"""
+
+import os
+import struct
+import zlib
+
+from .output import create
+
+BUFFER_SIZE = 1 << 20
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# Ancillary chunks that affect how the image is rendered. Every other
+# ancillary chunk (tEXt, iTXt, zTXt, eXIf, tIME, dSIG, private chunks...)
+# is metadata and is dropped.
+RENDERING_CHUNKS = {
+    b"tRNS", b"gAMA", b"cHRM", b"sRGB", b"sBIT", b"bKGD", b"pHYs", b"hIST",
+    b"sPLT", b"cICP", b"mDCV", b"cLLI",
+    b"acTL", b"fcTL", b"fdAT",  # APNG animation
+}
+
+
+def is_png(path):
+    with open(path, "rb") as f:
+        return f.read(8) == PNG_SIGNATURE
+
+
+def keep_chunk(chunk_type, keep_icc=False):
+    if not chunk_type[0] & 0x20:
+        return True  # Critical chunk: IHDR, PLTE, IDAT, IEND
+    if chunk_type == b"iCCP":
+        return keep_icc
+    return chunk_type in RENDERING_CHUNKS
+
+
+def iter_chunks(f):
+    """Yield (type, length) for each chunk header, leaving f at the chunk data.
+
+    The caller must consume exactly length + 4 bytes (data and CRC) before
+    asking for the next chunk.
+    """
+    while True:
+        header = f.read(8)
+        if not header:
+            raise ValueError("Truncated PNG: missing IEND")
+        if len(header) < 8:
+            raise ValueError("Truncated PNG chunk header")
+        length, chunk_type = struct.unpack(">I4s", header)
+        yield chunk_type, length
+        if chunk_type == b"IEND":
+            return
+
+
+def find_metadata(path, keep_icc=False):
+    """Return the types of the chunks strip_png would remove."""
+    found = []
+    with open(path, "rb") as src:
+        if src.read(8) != PNG_SIGNATURE:
+            raise ValueError("Not a PNG file")
+        for chunk_type, length in iter_chunks(src):
+            if not keep_chunk(chunk_type, keep_icc):
+                found.append(f"{chunk_type.decode('latin-1')} chunk")
+            src.seek(length + 4, 1)
+        if src.read(1):
+            found.append("data after IEND")
+    return found
+
+
+def strip_png(src_path, dst_path, keep_icc=False, bufsize=BUFFER_SIZE):
+    """Write a copy of src_path without metadata chunks to dst_path.
+
+    CRCs of copied chunks are verified. Returns the number of chunks removed.
+    """
+    removed = 0
+    with open(src_path, "rb") as src, create(dst_path, os.path.getsize(src_path)) as dst:
+        if src.read(8) != PNG_SIGNATURE:
+            raise ValueError("Not a PNG file")
+        dst.write(PNG_SIGNATURE)
+
+        for chunk_type, length in iter_chunks(src):
+            if not keep_chunk(chunk_type, keep_icc):
+                src.seek(length + 4, 1)
+                removed += 1
+                continue
+
+            dst.write(struct.pack(">I4s", length, chunk_type))
+            crc = zlib.crc32(chunk_type)
+            remaining = length
+            while remaining:
+                data = src.read(min(bufsize, remaining))
+                if not data:
+                    raise ValueError(f"Truncated PNG chunk {chunk_type.decode('latin-1')}")
+                crc = zlib.crc32(data, crc)
+                dst.write(data)
+                remaining -= len(data)
+
+            stored_crc = src.read(4)
+            if len(stored_crc) != 4 or struct.unpack(">I", stored_crc)[0] != crc:
+                raise ValueError(f"CRC mismatch in PNG chunk {chunk_type.decode('latin-1')}")
+            dst.write(stored_crc)
+    return removed
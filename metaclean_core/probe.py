@@ -0,0 +1,108 @@
+"""Cheap detection of metadata, used to skip files that are already clean.
+
+JPEG, PNG, WebP, HEIF, GIF, TIFF, MP4/MOV and Matroska/WebM headers are
+parsed natively by the same modules that clean them, so the report lists
+exactly what cleaning would remove. Other images (and TIFF layouts the
+native parser does not handle) are inspected with Pillow, which only reads
+headers on open, and other videos with a single ffprobe call. In ZIP and
+TAR archives every media entry is probed (see archive.find_metadata).
+"""
+
+import json
+import subprocess
+
+from . import jpeg, png, webp, heif, gif, tiff, isobmff, ebml
+from .errors import UnsupportedStructure
+from .formats import ARCHIVE_FORMATS, VIDEO_FORMATS, detect
+
+# Tags ffprobe reports that describe the stream layout rather than its origin
+TECHNICAL_TAGS = {"major_brand", "minor_version", "compatible_brands", "language",
+                  "handler_name", "vendor_id", "duration"}
+
+# TIFF/EXIF tags that identify the file's origin
+TIFF_METADATA_TAGS = {
+    270: "ImageDescription", 271: "Make", 272: "Model", 305: "Software",
+    306: "DateTime", 315: "Artist", 316: "HostComputer", 700: "XMP",
+    33432: "Copyright", 33723: "IPTC", 34377: "Photoshop", 34665: "ExifIFD",
+    34853: "GPSInfo", 37724: "ImageSourceData",
+}
+# Detected format -> (engine name, module with find_metadata)
+NATIVE_PROBES = {
+    "jpeg": ("jpeg", jpeg), "png": ("png", png), "webp": ("webp", webp), "heif": ("heif", heif),
+    "gif": ("gif", gif), "tiff": ("tiff", tiff),
+    "mp4": ("isobmff", isobmff), "mov": ("isobmff", isobmff),
+    "matroska": ("ebml", ebml), "webm": ("ebml", ebml),
+}
+PILLOW_METADATA_KEYS = ("exif", "xmp", "comment", "icc_profile", "photoshop", "iptc", "extension")
+
+
+def _ffprobe(file):
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-print_format", "json",
+         "-show_format", "-show_streams", "-show_chapters", file],
+        capture_output=True, check=True,
+    )
+    info = json.loads(result.stdout or b"{}")
+    found = []
+    for key in info.get("format", {}).get("tags", {}):
+        if key.lower() not in TECHNICAL_TAGS:
+            found.append(f"format tag {key}")
+    for stream in info.get("streams", []):
+        for key in stream.get("tags", {}):
+            if key.lower() not in TECHNICAL_TAGS:
+                found.append(f"stream {stream.get('index')} tag {key}")
+    if info.get("chapters"):
+        found.append(f"{len(info['chapters'])} chapters")
+    return found
+
+
+def _pillow(file):
+    from PIL import Image
+
+    found = []
+    with Image.open(file) as img:
+        for key in PILLOW_METADATA_KEYS:
+            if img.info.get(key):
+                found.append(key)
+        if hasattr(img, "tag_v2"):
+            found.extend(name for tag, name in TIFF_METADATA_TAGS.items() if tag in img.tag_v2)
+    return found
+
+
+def probe_file(file, kind=None):
+    """Return a report of the metadata in file, without modifying it.
+
+    The report is a dict with the file, the engine that inspected it and a
+    list of human-readable findings; an empty list means the file is clean.
+    kind is the format from formats.detect, sniffed here if not given.
+    """
+    kind = kind or detect(file)
+    engine = findings = None
+    if kind in ARCHIVE_FORMATS:
+        from . import archive
+
+        engine, findings = "archive", archive.find_metadata(file, kind)
+    elif kind in NATIVE_PROBES:
+        try:
+            engine, module = NATIVE_PROBES[kind]
+            findings = module.find_metadata(file)
+        except UnsupportedStructure:
+            if kind == "heif":
+                raise
+            # Same fallback as the cleaner: ffprobe for video, Pillow for TIFF
+    if findings is None:
+        if kind in VIDEO_FORMATS:
+            engine, findings = "ffprobe", _ffprobe(file)
+        else:
+            engine, findings = "pillow", _pillow(file)
+    return {"file": file, "engine": engine, "findings": findings}
+
+
+def is_clean(file, kind=None):
+    """Return True only if file is known to carry no metadata."""
+    if (kind or detect(file)) in ARCHIVE_FORMATS:
+        return False  # Entries are probed one by one as the archive is cleaned
+    try:
+        return not probe_file(file, kind)["findings"]
+    except Exception:
+        return False  # Unreadable or unusual: let the cleaner decide
@@ -0,0 +1,92 @@
+"""Byte-based progress, throughput and ETA for a batch."""
+
+import os
+import threading
+import time
+
+
+def file_size(file):
+    try:
+        return os.path.getsize(file)
+    except OSError:
+        return 0
+
+
+class ProgressTracker:
+    """Aggregates per-file byte progress across a batch.
+
+    update() may be called from any thread while a file is being processed;
+    finish() marks the whole file done. The callback receives a snapshot()
+    dict at most every interval seconds, and always for the last file.
+    Files in sizes ({file: bytes}) are not stat'ed again.
+    """
+
+    def __init__(self, files, callback=None, interval=0.5, sizes=None):
+        sizes = sizes or {}
+        self.sizes = {file: sizes[file] if file in sizes else file_size(file) for file in files}
+        self.total_bytes = sum(self.sizes.values())
+        self.total_files = len(self.sizes)
+        self.callback = callback
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.partial = {}  # file -> bytes done so far, for files in progress
+        self.done_bytes = 0
+        self.done_files = 0
+        self.started = time.monotonic()
+        self.last_report = 0.0
+
+    def update(self, file, bytes_done):
+        with self.lock:
+            self.partial[file] = min(bytes_done, self.sizes.get(file, 0))
+        self._report()
+
+    def finish(self, file):
+        with self.lock:
+            self.partial.pop(file, None)
+            self.done_bytes += self.sizes.get(file, 0)
+            self.done_files += 1
+            last = self.done_files >= self.total_files
+        self._report(force=last)
+
+    def snapshot(self):
+        with self.lock:
+            bytes_done = self.done_bytes + sum(self.partial.values())
+            files_done = self.done_files
+        elapsed = time.monotonic() - self.started
+        bytes_per_s = bytes_done / elapsed if elapsed > 0 else 0.0
+        remaining = self.total_bytes - bytes_done
+        return {
+            "files_done": files_done,
+            "files_total": self.total_files,
+            "bytes_done": bytes_done,
+            "bytes_total": self.total_bytes,
+            "elapsed": elapsed,
+            "bytes_per_s": bytes_per_s,
+            "files_per_s": files_done / elapsed if elapsed > 0 else 0.0,
+            "eta": remaining / bytes_per_s if bytes_per_s > 0 else None,
+            "percent": 100.0 * bytes_done / self.total_bytes if self.total_bytes else
+                       100.0 * files_done / max(1, self.total_files),
+        }
+
+    def _report(self, force=False):
+        if not self.callback:
+            return
+        now = time.monotonic()
+        with self.lock:
+            if not force and now - self.last_report < self.interval:
+                return
+            self.last_report = now
+        self.callback(self.snapshot())
+
+
+def format_progress(snapshot):
+    """One-line summary such as '42% | 118.3 MB/s | 12.5 files/s | ETA 3:05'."""
+    eta = snapshot["eta"]
+    if eta is None:
+        eta_text = "--:--"
+    else:
+        minutes, seconds = divmod(int(eta), 60)
+        hours, minutes = divmod(minutes, 60)
+        eta_text = f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+    return (f"{snapshot['percent']:.0f}% | {snapshot['bytes_per_s'] / 1e6:.1f} MB/s | "
+            f"{snapshot['files_per_s']:.1f} files/s | ETA {eta_text}")
@@ -0,0 +1,135 @@
+"""Ordering a batch by size, with separate I/O and CPU lanes.
+
+Every file is sized up front (usually by discovery, see
+discovery.discover_sized) and put in a lane: videos, archives and images
+of IO_HEAVY_MIN bytes or more are disk-bound and go in the I/O lane, other
+images are CPU-bound and go in the CPU lane. Each lane has its own limit
+on jobs in flight, so a few huge remuxes never hold up a stream of small
+images, and small images never start so many disk-heavy jobs at once that
+the disk thrashes. Within a lane the largest jobs start first, so the
+longest ones overlap the rest of the batch instead of running alone at the
+end.
+
+An optional bandwidth limit paces job starts so that, on average, files
+are read at no more than the given rate.
+"""
+
+import os
+import time
+from collections import deque, namedtuple
+
+from .formats import ARCHIVE_EXTENSIONS, is_video
+
+IO = "io"
+CPU = "cpu"
+
+# Stripping an image this large is mostly waiting on the disk
+IO_HEAVY_MIN = 64 << 20
+
+Job = namedtuple("Job", "file size lane")
+
+
+def lane(file, size):
+    if is_video(file) or file.lower().endswith(ARCHIVE_EXTENSIONS) or size >= IO_HEAVY_MIN:
+        return IO
+    return CPU
+
+
+def size_jobs(files, sizes=None):
+    """Return a Job for each file, using sizes ({file: bytes}) where known."""
+    sizes = sizes or {}
+    jobs = []
+    for file in files:
+        size = sizes.get(file)
+        if size is None:
+            try:
+                size = os.stat(file).st_size
+            except OSError:
+                size = 0  # Vanished; cleaning it reports the error
+        jobs.append(Job(file, size, lane(file, size)))
+    return jobs
+
+
+class BandwidthLimit:
+    """Token bucket pacing job starts to rate bytes per second.
+
+    A job takes its whole size when it starts, so one large file is not
+    slowed down itself; the jobs after it start later instead. Up to one
+    second's worth of bytes may start at once.
+    """
+
+    def __init__(self, rate, clock=time.monotonic):
+        if rate <= 0:
+            raise ValueError("Bandwidth limit must be positive")
+        self.rate = rate
+        self.clock = clock
+        self.tokens = float(rate)
+        self.last = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.rate, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def delay(self):
+        """Return the seconds until another job may start."""
+        self._refill()
+        return max(0.0, -self.tokens / self.rate)
+
+    def take(self, size):
+        self._refill()
+        self.tokens -= size
+
+
+class Scheduler:
+    """Decides which jobs of a batch start next.
+
+    limits maps each lane to the most jobs it may have in flight. Call
+    start() for the jobs to submit now and finished() as each one ends.
+    Not thread-safe; the batch drives it from a single thread.
+    """
+
+    def __init__(self, jobs, limits, bandwidth=None):
+        self.limits = limits
+        self.queues = {name: deque() for name in limits}
+        for job in sorted(jobs, key=lambda job: job.size, reverse=True):
+            self.queues[job.lane].append(job)
+        self.running = dict.fromkeys(limits, 0)
+        self.limit = BandwidthLimit(bandwidth) if bandwidth else None
+
+    def _open_lanes(self):
+        return [name for name, queue in self.queues.items()
+                if queue and self.running[name] < self.limits[name]]
+
+    def start(self):
+        """Return the jobs to submit now; they count as running until finished()."""
+        started = []
+        lanes = self._open_lanes()
+        # Take from the lanes in turn, so neither uses up the bandwidth budget alone
+        while lanes:
+            for name in lanes:
+                if self.limit and self.limit.delay():
+                    return started
+                job = self.queues[name].popleft()
+                if self.limit:
+                    self.limit.take(job.size)
+                self.running[name] += 1
+                started.append(job)
+            lanes = self._open_lanes()
+        return started
+
+    def delay(self):
+        """Return how long until start() has more work, or None to wait for finished()."""
+        if self.limit and self._open_lanes():
+            return self.limit.delay()
+        return None
+
+    def finished(self, job):
+        self.running[job.lane] -= 1
+
+    def running_jobs(self):
+        return sum(self.running.values())
+
+    def __bool__(self):
+        """Whether any job is still queued or running."""
+        return bool(self.running_jobs() or any(self.queues.values()))
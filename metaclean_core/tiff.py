@@ -0,0 +1,236 @@
+"""Streaming TIFF metadata removal at the IFD level.
+
+Every page in the main IFD chain is rewritten with only the tags needed to
+decode and display it, and its strips or tiles are copied one at a time
+(in the kernel where possible, see output.copy_range), so memory use does
+not depend on the image size and nothing is decompressed. Exif and GPS
+IFDs, XMP, IPTC, Photoshop resources, descriptive text tags and SubIFDs
+(previews) are dropped.
+
+Only classic TIFF is handled; BigTIFF and old-style JPEG compression raise
+UnsupportedStructure before anything is written.
+"""
+
+import os
+import struct
+
+from .errors import UnsupportedStructure
+from .output import copy_range, create
+
+BUFFER_SIZE = 1 << 20
+MAX_PAGES = 65536
+
+# Field type -> size in bytes of one value
+TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8, 13: 4}
+SHORT = 3
+LONG = 4
+
+COMPRESSION = 259
+OLD_JPEG = 6
+STRIP_OFFSETS = 273
+STRIP_BYTE_COUNTS = 279
+TILE_OFFSETS = 324
+TILE_BYTE_COUNTS = 325
+ICC_PROFILE = 34675
+
+# Tags that describe how to decode and display the pixels. Every other tag
+# (Make, Model, DateTime, Software, Exif and GPS IFDs, XMP, IPTC...) is dropped
+IMAGE_TAGS = {
+    254, 255, 256, 257, 258, 259, 262, 263, 264, 265, 266, 273, 274, 277, 278,
+    279, 280, 281, 282, 283, 284, 290, 291, 292, 293, 296, 297, 301, 317, 318,
+    319, 320, 321, 322, 323, 324, 325, 332, 333, 334, 336, 338, 339, 340, 341,
+    342, 347, 529, 530, 531, 532, 32997, 32998,
+}
+
+# Names of common metadata tags, for find_metadata
+TAG_NAMES = {
+    269: "DocumentName", 270: "ImageDescription", 271: "Make", 272: "Model",
+    285: "PageName", 305: "Software", 306: "DateTime", 315: "Artist",
+    316: "HostComputer", 330: "SubIFDs", 700: "XMP", 33432: "Copyright",
+    33723: "IPTC", 34377: "Photoshop", 34665: "ExifIFD", 34675: "ICCProfile",
+    34853: "GPSInfo", 37724: "ImageSourceData",
+}
+
+
+def is_tiff(path):
+    with open(path, "rb") as f:
+        return f.read(4) in (b"II*\0", b"MM\0*")
+
+
+def keep_tag(tag, keep_icc=False):
+    if tag == ICC_PROFILE:
+        return keep_icc
+    return tag in IMAGE_TAGS
+
+
+def _read_header(f):
+    head = f.read(8)
+    if head[:4] == b"II*\0":
+        order = "<"
+    elif head[:4] == b"MM\0*":
+        order = ">"
+    elif head[:4] in (b"II+\0", b"MM\0+"):
+        raise UnsupportedStructure("BigTIFF")
+    else:
+        raise ValueError("Not a TIFF file")
+    if len(head) < 8:
+        raise ValueError("Truncated TIFF header")
+    return order, struct.unpack(order + "I", head[4:8])[0]
+
+
+def _read_ifd(f, order, offset, file_size):
+    """Return ([(tag, type, count, value field)], next IFD offset)."""
+    if offset + 2 > file_size:
+        raise UnsupportedStructure("IFD outside the file")
+    f.seek(offset)
+    count = struct.unpack(order + "H", f.read(2))[0]
+    data = f.read(12 * count + 4)
+    if len(data) < 12 * count + 4:
+        raise UnsupportedStructure("Truncated IFD")
+    entries = [struct.unpack_from(order + "HHI4s", data, 12 * i) for i in range(count)]
+    return entries, struct.unpack_from(order + "I", data, 12 * count)[0]
+
+
+def _value(f, order, field_type, count, field, file_size):
+    """Return the raw bytes of a tag value, in the file's byte order."""
+    if field_type not in TYPE_SIZES:
+        raise UnsupportedStructure(f"Unknown TIFF field type {field_type}")
+    size = TYPE_SIZES[field_type] * count
+    if size <= 4:
+        return field[:size]
+    offset = struct.unpack(order + "I", field)[0]
+    if offset + size > file_size:
+        raise UnsupportedStructure("Tag value outside the file")
+    f.seek(offset)
+    return f.read(size)
+
+
+def _ints(order, field_type, raw):
+    if field_type == SHORT:
+        return struct.unpack(f"{order}{len(raw) // 2}H", raw)
+    if field_type == LONG:
+        return struct.unpack(f"{order}{len(raw) // 4}I", raw)
+    raise UnsupportedStructure(f"Offsets stored as field type {field_type}")
+
+
+def _read_page(f, order, entries, file_size, keep_icc):
+    """Return (kept tags, offsets tag, [(offset, length)] of image data, dropped tags)."""
+    kept = {}
+    dropped = []
+    for tag, field_type, count, field in entries:
+        if not keep_tag(tag, keep_icc):
+            dropped.append(tag)
+            continue
+        kept[tag] = (field_type, count, _value(f, order, field_type, count, field, file_size))
+
+    if COMPRESSION in kept and _ints(order, *kept[COMPRESSION][::2])[0] == OLD_JPEG:
+        raise UnsupportedStructure("Old-style JPEG compression")
+    if TILE_OFFSETS in kept:
+        offsets_tag, counts_tag = TILE_OFFSETS, TILE_BYTE_COUNTS
+    else:
+        offsets_tag, counts_tag = STRIP_OFFSETS, STRIP_BYTE_COUNTS
+    if offsets_tag not in kept or counts_tag not in kept:
+        raise UnsupportedStructure("Page without strip or tile byte counts")
+    offsets = _ints(order, *kept[offsets_tag][::2])
+    lengths = _ints(order, *kept[counts_tag][::2])
+    if len(offsets) != len(lengths):
+        raise UnsupportedStructure("Mismatched strip offsets and byte counts")
+    for offset, length in zip(offsets, lengths):
+        if offset + length > file_size:
+            raise UnsupportedStructure("Image data outside the file")
+    return kept, offsets_tag, list(zip(offsets, lengths)), dropped
+
+
+def _pages(f, keep_icc=False):
+    """Parse every page up front, so unsupported files fail before any write."""
+    f.seek(0, 2)
+    file_size = f.tell()
+    f.seek(0)
+    order, offset = _read_header(f)
+    pages = []
+    seen = set()
+    while offset:
+        if offset in seen or len(pages) >= MAX_PAGES:
+            raise UnsupportedStructure("Looping IFD chain")
+        seen.add(offset)
+        entries, offset = _read_ifd(f, order, offset, file_size)
+        pages.append(_read_page(f, order, entries, file_size, keep_icc))
+    if not pages:
+        raise UnsupportedStructure("TIFF without pages")
+    return order, pages
+
+
+def _align(dst):
+    # Values and IFDs must start on a word boundary
+    if dst.tell() & 1:
+        dst.write(b"\0")
+
+
+def _offset(order, pos):
+    if pos > 0xFFFFFFFF:
+        raise ValueError("Output too large for classic TIFF")
+    return struct.pack(order + "I", pos)
+
+
+def _write_page(src, dst, order, page, bufsize):
+    """Write one page's image data, tag values and IFD.
+
+    Returns the offset of the IFD and of its next-IFD field.
+    """
+    kept, offsets_tag, extents, _ = page
+    new_offsets = []
+    for offset, length in extents:
+        new_offsets.append(dst.tell())
+        copy_range(src, dst, offset, length, bufsize)
+    kept = dict(kept)
+    kept[offsets_tag] = (LONG, len(new_offsets),
+                         b"".join(_offset(order, pos) for pos in new_offsets))
+
+    fields = []
+    for tag in sorted(kept):
+        field_type, count, raw = kept[tag]
+        if len(raw) > 4:
+            _align(dst)
+            field = _offset(order, dst.tell())
+            dst.write(raw)
+        else:
+            field = raw.ljust(4, b"\0")
+        fields.append(struct.pack(order + "HHI", tag, field_type, count) + field)
+
+    _align(dst)
+    ifd_pos = dst.tell()
+    dst.write(struct.pack(order + "H", len(fields)) + b"".join(fields) + b"\0\0\0\0")
+    return ifd_pos, ifd_pos + 2 + 12 * len(fields)
+
+
+def find_metadata(path, keep_icc=False):
+    """Return the names of the tags strip_tiff would remove."""
+    with open(path, "rb") as f:
+        _, pages = _pages(f, keep_icc)
+    found = []
+    for _, _, _, dropped in pages:
+        for tag in dropped:
+            name = TAG_NAMES.get(tag, f"tag {tag}")
+            if name not in found:
+                found.append(name)
+    return found
+
+
+def strip_tiff(src_path, dst_path, keep_icc=False, bufsize=BUFFER_SIZE):
+    """Write a copy of src_path without metadata tags to dst_path.
+
+    Returns the number of tags removed, over all pages.
+    """
+    with open(src_path, "rb") as src, create(dst_path, os.path.getsize(src_path)) as dst:
+        order, pages = _pages(src, keep_icc)
+        dst.write((b"II*\0" if order == "<" else b"MM\0*") + b"\0\0\0\0")
+        # Where the offset of the next IFD goes: the header, then each IFD's tail
+        link = 4
+        for page in pages:
+            ifd_pos, next_link = _write_page(src, dst, order, page, bufsize)
+            end = dst.tell()
+            dst.seek(link)
+            dst.write(_offset(order, ifd_pos))
+            dst.seek(end)
+            link = next_link
+    return sum(len(page[3]) for page in pages)
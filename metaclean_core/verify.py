@@ -0,0 +1,140 @@
+"""Post-clean verification of a staged file against its original.
+
+The content must be unchanged and a probe of the staged file must find no
+metadata; a file that fails is not committed, so the original survives.
+
+- Videos: the packets of every video, audio and subtitle stream are
+  hashed with ffmpeg's streamhash muxer, for both files at once. Cover
+  art, data and attachment streams are metadata and are not compared.
+- Images: frames are decoded with Pillow one at a time and hashed in
+  bands of rows, so memory stays within one decoded frame.
+- HEIC, which Pillow cannot decode: the data of every item except the
+  Exif and XMP ones.
+- Archives: each media entry is verified as it is cleaned (see
+  archive.clean_archive), so the archive itself is not checked again.
+
+ffmpeg_async.verify_video_async runs the video checks on the event loop.
+"""
+
+import hashlib
+import subprocess
+import time
+
+from . import heif, probe
+from .errors import FFmpegError, FFmpegTimeout, VerificationError
+from .formats import ARCHIVE_FORMATS, VIDEO_FORMATS
+
+BAND_ROWS = 256
+# Streams the remux copies (see cleaner.remux_stream); V skips cover art
+STREAM_MAPS = ("0:V?", "0:a?", "0:s?")
+STREAM_TYPES = {"v": "video", "a": "audio", "s": "subtitle"}
+
+
+def stream_hash_args(file):
+    args = ["ffmpeg", "-v", "error", "-nostdin", "-i", file]
+    for stream_map in STREAM_MAPS:
+        args += ["-map", stream_map]
+    return args + ["-c", "copy", "-f", "streamhash", "-hash", "sha256", "-"]
+
+
+def parse_stream_hashes(output):
+    """Return [(stream type, hash)] from streamhash output, in stream order."""
+    hashes = []
+    for line in output.decode("ascii", "replace").splitlines():
+        fields = line.strip().split(",")
+        if len(fields) == 3:
+            hashes.append((fields[1], fields[2]))
+    return hashes
+
+
+def stream_hashes(files, timeout=None):
+    """Hash the streams of several files, running one ffmpeg per file at once.
+
+    Raises FFmpegTimeout if they take longer than timeout seconds in all.
+    """
+    deadline = time.monotonic() + timeout if timeout else None
+    processes = [subprocess.Popen(stream_hash_args(file), stdin=subprocess.DEVNULL,
+                                  stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                 for file in files]
+    results = []
+    try:
+        for process in processes:
+            try:
+                out, err = process.communicate(timeout=deadline and max(0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                raise FFmpegTimeout(f"ffmpeg did not finish hashing within {timeout:.0f} s")
+            if process.returncode:
+                raise FFmpegError(err)
+            results.append(parse_stream_hashes(out))
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+    return results
+
+
+def compare_streams(original, cleaned):
+    original_types = [STREAM_TYPES.get(kind, kind) for kind, _ in original]
+    cleaned_types = [STREAM_TYPES.get(kind, kind) for kind, _ in cleaned]
+    if original_types != cleaned_types:
+        raise VerificationError(f"Streams changed from {', '.join(original_types) or 'none'} "
+                                f"to {', '.join(cleaned_types) or 'none'}")
+    for i, ((kind, before), (_, after)) in enumerate(zip(original, cleaned)):
+        if before != after:
+            raise VerificationError(f"Packets of {STREAM_TYPES.get(kind, kind)} stream {i} differ")
+
+
+def image_digests(file, kind):
+    """Return one digest per frame of the decoded image (mode, size, palette, pixels)."""
+    if kind == "heif":
+        return [heif.data_digest(file)]
+
+    from PIL import Image, ImageSequence
+
+    digests = []
+    with Image.open(file) as img:
+        for frame in ImageSequence.Iterator(img):
+            width, height = frame.size
+            digest = hashlib.sha256(f"{frame.mode} {width}x{height}".encode())
+            palette = frame.getpalette()
+            if palette:
+                digest.update(bytes(palette))
+            for top in range(0, height, BAND_ROWS):
+                digest.update(frame.crop((0, top, width, min(height, top + BAND_ROWS))).tobytes())
+            digests.append(digest.hexdigest())
+    return digests
+
+
+def compare_images(original, cleaned):
+    if len(original) != len(cleaned):
+        raise VerificationError(f"{len(original)} frames became {len(cleaned)}")
+    for i, (before, after) in enumerate(zip(original, cleaned)):
+        if before != after:
+            raise VerificationError("Image data differs" if len(original) == 1
+                                    else f"Image data of frame {i} differs")
+
+
+def check_metadata(file, kind):
+    findings = probe.probe_file(file, kind)["findings"]
+    if findings:
+        raise VerificationError(f"Metadata left: {', '.join(findings)}")
+
+
+def verify_file(original, cleaned, kind, timeout=None):
+    """Raise VerificationError unless cleaned is a faithful, clean copy of original.
+
+    Video hashing is given up after timeout seconds (see stream_hashes).
+    """
+    if kind in ARCHIVE_FORMATS:
+        return
+    if kind in VIDEO_FORMATS:
+        compare_streams(*stream_hashes([original, cleaned], timeout))
+    else:
+        before = image_digests(original, kind)
+        try:
+            after = image_digests(cleaned, kind)
+        except Exception as e:
+            raise VerificationError(f"Cleaned image cannot be decoded: {e}") from e
+        compare_images(before, after)
+    check_metadata(cleaned, kind)
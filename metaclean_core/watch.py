@@ -0,0 +1,292 @@
+"""Watch folders and clean files as they arrive.
+
+On Linux the kernel reports changes through inotify, so the tree is only
+walked once when a watch is set up (and for folders created or moved in
+later). Elsewhere, or when inotify is unavailable, the folders are polled
+with os.scandir and compared against the previous listing.
+
+A changed file is only handed to the cleaner once it has settled: no new
+events for ``settle`` seconds and the same size and mtime as when it was
+last seen, so half-uploaded files are never rewritten. Files rewritten by
+the cleaner itself are recognised by their post-clean stat and ignored;
+that record is dropped when the file is deleted or moved away, so a
+long-running watch does not keep one entry per file it ever cleaned.
+"""
+
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+from .discovery import is_supported, discover
+from .formats import SUPPORTED_EXTENSIONS
+
+# inotify(7)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_MOVED_FROM
+              | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+EVENT_HEADER = struct.Struct("iIII")
+READ_SIZE = 64 * 1024
+
+DEFAULT_SETTLE_S = 2.0
+DEFAULT_POLL_INTERVAL_S = 2.0
+TICK_S = 0.5  # How often settled files and stop() are checked
+
+
+def _stat_key(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+class InotifySource:
+    """Reports paths that changed under the watched folders via inotify."""
+
+    def __init__(self, roots, recursive=True):
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._get_errno = ctypes.get_errno
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.recursive = recursive
+        self.dirs = {}  # watch descriptor -> folder
+        for root in roots:
+            self._watch_tree(root)
+
+    def _watch(self, folder):
+        wd = self._add_watch(self.fd, os.fsencode(folder), WATCH_MASK)
+        if wd < 0:
+            errno = self._get_errno()
+            raise OSError(errno, f"Cannot watch {folder}: {os.strerror(errno)}")
+        self.dirs[wd] = folder
+
+    def _watch_tree(self, folder):
+        """Watch folder (and its sub-folders); returns the files already in it."""
+        self._watch(folder)
+        files = []
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False) and self.recursive:
+                    files.extend(self._watch_tree(entry.path))
+                elif entry.is_file():
+                    files.append(entry.path)
+        return files
+
+    def read(self, timeout):
+        """Wait up to timeout seconds; returns (changed paths, removed paths, overflowed).
+
+        A removed folder is reported as a single path.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return [], [], False
+        try:
+            data = os.read(self.fd, READ_SIZE)
+        except BlockingIOError:
+            return [], [], False
+
+        changed = []
+        removed = []
+        overflowed = False
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                overflowed = True
+                continue
+            if mask & IN_IGNORED:
+                self.dirs.pop(wd, None)  # Folder removed or unmounted
+                continue
+            folder = self.dirs.get(wd)
+            if folder is None or not name:
+                continue
+            path = os.path.join(folder, os.fsdecode(name))
+            if mask & (IN_DELETE | IN_MOVED_FROM):
+                removed.append(path)
+            elif mask & IN_ISDIR:
+                if self.recursive and mask & (IN_CREATE | IN_MOVED_TO):
+                    # Files can land in a new folder before its watch exists
+                    try:
+                        changed.extend(self._watch_tree(path))
+                    except OSError:
+                        pass  # Already gone again
+            else:
+                changed.append(path)
+        return changed, removed, overflowed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingSource:
+    """Reports changed paths by comparing periodic listings of the folders."""
+
+    def __init__(self, roots, recursive=True, interval=DEFAULT_POLL_INTERVAL_S,
+                 extensions=SUPPORTED_EXTENSIONS):
+        self.roots = roots
+        self.recursive = recursive
+        self.interval = interval
+        self.extensions = extensions
+        self.seen = self._scan()
+        self.next_scan = time.monotonic() + interval
+
+    def _scan(self):
+        seen = {}
+        for file in discover(self.roots, self.recursive, self.extensions):
+            seen[file] = _stat_key(file)
+        return seen
+
+    def read(self, timeout):
+        delay = self.next_scan - time.monotonic()
+        if delay > timeout:
+            time.sleep(timeout)
+            return [], [], False
+        time.sleep(max(0.0, delay))
+        self.next_scan = time.monotonic() + self.interval
+        seen = self._scan()
+        changed = [file for file, key in seen.items() if self.seen.get(file) != key]
+        removed = [file for file in self.seen if file not in seen]
+        self.seen = seen
+        return changed, removed, False
+
+    def close(self):
+        pass
+
+
+def open_source(roots, recursive=True, polling=False, poll_interval=DEFAULT_POLL_INTERVAL_S,
+                extensions=SUPPORTED_EXTENSIONS):
+    """Use inotify where available, otherwise fall back to polling."""
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            return InotifySource(roots, recursive)
+        except (OSError, AttributeError):
+            pass  # No inotify in this libc, or out of watches
+    return PollingSource(roots, recursive, poll_interval, extensions)
+
+
+class Watcher:
+    """Feeds new and changed files under roots into a BatchEngine.
+
+    run() blocks until stop() is called (from another thread or a signal
+    handler). Settled files are cleaned in batches using the engine's
+    concurrency; events that arrive meanwhile are queued by the kernel (or
+    picked up by the next poll) and handled afterwards.
+    """
+
+    def __init__(self, roots, engine, recursive=True, settle=DEFAULT_SETTLE_S,
+                 polling=False, poll_interval=DEFAULT_POLL_INTERVAL_S,
+                 extensions=SUPPORTED_EXTENSIONS):
+        if isinstance(roots, str):
+            roots = [roots]
+        for root in roots:
+            if not os.path.isdir(root):
+                raise NotADirectoryError(f"Not a folder: {root}")
+        self.roots = roots
+        self.engine = engine
+        self.recursive = recursive
+        self.settle = settle
+        self.polling = polling
+        self.poll_interval = poll_interval
+        self.extensions = extensions
+        self.pending = {}  # file -> (time of last event, stat key then)
+        self.cleaned = {}  # file -> stat key right after we cleaned it
+        self.stopped = threading.Event()
+
+    def stop(self):
+        self.stopped.set()
+        self.engine.cancel()
+
+    def _note(self, files):
+        now = time.monotonic()
+        for file in files:
+            if is_supported(file, self.extensions):
+                self.pending[file] = (now, _stat_key(file))
+
+    def _forget(self, paths):
+        """Drop what is known about removed files, and files in removed folders."""
+        for path in paths:
+            self.pending.pop(path, None)
+            self.cleaned.pop(path, None)
+        folders = tuple(os.path.join(path, "") for path in paths)
+        if folders:
+            for known in (self.pending, self.cleaned):
+                for file in [file for file in known if file.startswith(folders)]:
+                    del known[file]
+
+    def _settled(self):
+        now = time.monotonic()
+        ready = []
+        for file, (last_event, key) in list(self.pending.items()):
+            if now - last_event < self.settle:
+                continue
+            current = _stat_key(file)
+            if current is None:
+                del self.pending[file]  # Deleted or renamed away
+                self.cleaned.pop(file, None)
+            elif current != key:
+                self.pending[file] = (now, current)  # Still being written
+            else:
+                del self.pending[file]
+                # Our own replace or in-place edit comes back as an event
+                if self.cleaned.get(file) != current:
+                    ready.append(file)
+        return ready
+
+    def run(self, on_start=None, on_result=None, on_skip=None, on_ready=None):
+        """Watch until stop(); callbacks are as for BatchEngine.run.
+
+        on_ready(files) is called with each batch of settled files before
+        it is cleaned.
+        """
+        def record(file, error):
+            if error is None:
+                self.cleaned[file] = _stat_key(file)
+            if on_result:
+                on_result(file, error)
+
+        source = open_source(self.roots, self.recursive, self.polling, self.poll_interval,
+                             self.extensions)
+        try:
+            while not self.stopped.is_set():
+                changed, removed, overflowed = source.read(TICK_S)
+                if overflowed:
+                    # Events were lost, fall back to one full listing
+                    changed = list(discover(self.roots, self.recursive, self.extensions))
+                    removed = list(set(self.cleaned).difference(changed))
+                self._forget(removed)
+                self._note(changed)
+                ready = self._settled()
+                if ready and not self.stopped.is_set():
+                    if on_ready:
+                        on_ready(ready)
+                    self.engine.run(ready, on_start, record, on_skip)
+        finally:
+            source.close()
@@ -0,0 +1,88 @@
+"""Streaming WebP metadata removal at the RIFF chunk level.
+
+Only extended (VP8X) files can carry metadata, in EXIF, XMP and ICCP
+chunks next to the image data. Those chunks are dropped, the VP8X feature
+flags and the RIFF size are updated, and the compressed image data is copied
+in the kernel (see output.copy_range) without being decoded.
+"""
+
+import os
+import struct
+
+from .output import copy_range, create
+
+BUFFER_SIZE = 1 << 20
+
+# Chunks needed to render the image; anything else (EXIF, XMP, unknown
+# chunks) is dropped
+IMAGE_CHUNKS = {b"VP8 ", b"VP8L", b"VP8X", b"ALPH", b"ANIM", b"ANMF"}
+
+# VP8X feature flags
+FLAG_ICC = 0x20
+FLAG_EXIF = 0x08
+FLAG_XMP = 0x04
+
+
+def is_webp(path):
+    with open(path, "rb") as f:
+        header = f.read(12)
+    return header[:4] == b"RIFF" and header[8:12] == b"WEBP"
+
+
+def keep_chunk(chunk_type, keep_icc=False):
+    if chunk_type == b"ICCP":
+        return keep_icc
+    return chunk_type in IMAGE_CHUNKS
+
+
+def iter_chunks(f):
+    """Yield (type, offset of data, length) for each chunk after the header."""
+    header = f.read(12)
+    if header[:4] != b"RIFF" or header[8:12] != b"WEBP":
+        raise ValueError("Not a WebP file")
+    end = 8 + struct.unpack("<I", header[4:8])[0]
+    pos = 12
+    while pos < end:
+        f.seek(pos)
+        chunk_header = f.read(8)
+        if len(chunk_header) < 8:
+            raise ValueError("Truncated WebP chunk header")
+        chunk_type, length = struct.unpack("<4sI", chunk_header)
+        yield chunk_type, pos + 8, length
+        pos += 8 + length + (length & 1)  # Chunks are padded to even sizes
+
+
+def find_metadata(path, keep_icc=False):
+    """Return the types of the chunks strip_webp would remove."""
+    with open(path, "rb") as f:
+        return [f"{chunk_type.decode('latin-1').strip()} chunk"
+                for chunk_type, _, _ in iter_chunks(f) if not keep_chunk(chunk_type, keep_icc)]
+
+
+def strip_webp(src_path, dst_path, keep_icc=False, bufsize=BUFFER_SIZE):
+    """Write a copy of src_path without metadata chunks to dst_path.
+
+    Returns the number of chunks removed.
+    """
+    with open(src_path, "rb") as src, create(dst_path, os.path.getsize(src_path)) as dst:
+        chunks = list(iter_chunks(src))
+        kept = [chunk for chunk in chunks if keep_chunk(chunk[0], keep_icc)]
+        riff_size = 4 + sum(8 + length + (length & 1) for _, _, length in kept)
+        dst.write(b"RIFF" + struct.pack("<I", riff_size) + b"WEBP")
+
+        for chunk_type, offset, length in kept:
+            padded = length + (length & 1)
+            dst.write(struct.pack("<4sI", chunk_type, length))
+            src.seek(offset)
+            if chunk_type == b"VP8X":
+                payload = bytearray(src.read(padded))
+                if len(payload) < 10:
+                    raise ValueError("Truncated WebP VP8X chunk")
+                payload[0] &= ~(FLAG_EXIF | FLAG_XMP | (0 if keep_icc else FLAG_ICC)) & 0xFF
+                dst.write(payload)
+                continue
+            try:
+                copy_range(src, dst, offset, padded, bufsize)
+            except ValueError:
+                raise ValueError(f"Truncated WebP chunk {chunk_type.decode('latin-1')}") from None
+    return len(chunks) - len(kept)
@@ -0,0 +1,307 @@
+"""Round trips through every format-level stripper.
+
+Fixtures are built in code: images with Pillow, videos from ffmpeg's
+lavfi test sources (those tests are skipped without ffmpeg). Each stripper
+must leave the pixels or stream packets exactly as they were and leave
+nothing for its find_metadata to report; truncated and corrupt inputs must
+raise the documented error.
+"""
+
+import os
+import shutil
+import subprocess
+
+import pytest
+from PIL import Image, ImageSequence, PngImagePlugin, features
+
+from metaclean_core import ebml, gif, heif, isobmff, jpeg, png, tiff, verify, webp
+from metaclean_core.cleaner import clean_file
+from metaclean_core.errors import UnsupportedStructure
+
+XMP_PACKET = (b'<x:xmpmeta xmlns:x="adobe:ns:meta/"><rdf:RDF xmlns:rdf='
+              b'"http://www.w3.org/1999/02/22-rdf-syntax-ns#"><rdf:Description '
+              b'xmlns:xmp="http://ns.adobe.com/xap/1.0/" xmp:CreatorTool="test"/>'
+              b'</rdf:RDF></x:xmpmeta>')
+
+FFMETADATA = """;FFMETADATA1
+title=secret title
+[CHAPTER]
+TIMEBASE=1/1000
+START=0
+END=500
+title=Secret chapter
+"""
+
+needs_ffmpeg = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg not installed")
+
+
+def _exif():
+    exif = Image.Exif()
+    exif[0x010F] = "TestCam"  # Make
+    exif[0x0132] = "2024:04:08 13:00:35"  # DateTime
+    return exif
+
+
+def _image(mode="RGB", size=(64, 48)):
+    # Deterministic but not flat, so a decode that drops rows would show
+    img = Image.linear_gradient("L").resize(size)
+    return Image.merge("RGB", (img, img.transpose(Image.Transpose.FLIP_LEFT_RIGHT), img)).convert(mode)
+
+
+def _frames(path):
+    with Image.open(path) as img:
+        return [(frame.mode, frame.size, frame.getpalette(), frame.tobytes())
+                for frame in ImageSequence.Iterator(img)]
+
+
+def _truncate(src, dst, keep):
+    with open(src, "rb") as f:
+        data = f.read()
+    with open(dst, "wb") as f:
+        f.write(data[:keep if keep > 0 else len(data) + keep])
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+@pytest.fixture
+def jpeg_file(tmp_path):
+    path = tmp_path / "in.jpg"
+    _image().save(path, "JPEG", exif=_exif(), comment=b"secret", xmp=XMP_PACKET)
+    return str(path)
+
+
+@pytest.fixture
+def png_file(tmp_path):
+    path = tmp_path / "in.png"
+    info = PngImagePlugin.PngInfo()
+    info.add_text("Author", "secret")
+    info.add_itxt("XML:com.adobe.xmp", XMP_PACKET.decode(), zip=True)
+    _image().save(path, "PNG", pnginfo=info, exif=_exif())
+    return str(path)
+
+
+@pytest.fixture
+def webp_file(tmp_path):
+    path = tmp_path / "in.webp"
+    _image().save(path, "WEBP", lossless=True, exif=_exif(), xmp=XMP_PACKET)
+    return str(path)
+
+
+@pytest.fixture
+def gif_file(tmp_path):
+    path = tmp_path / "in.gif"
+    frames = [_image("P"), _image("P").transpose(Image.Transpose.FLIP_TOP_BOTTOM)]
+    frames[0].save(path, "GIF", save_all=True, append_images=frames[1:], duration=100, loop=0,
+                   comment=b"secret")
+    return str(path)
+
+
+@pytest.fixture
+def tiff_file(tmp_path):
+    path = tmp_path / "in.tiff"
+    tags = {270: "secret description", 271: "TestCam", 305: "test software"}
+    pages = [_image(), _image().rotate(180)]
+    pages[0].save(path, "TIFF", save_all=True, append_images=pages[1:], tiffinfo=tags,
+                  compression="tiff_lzw")
+    return str(path)
+
+
+@pytest.fixture
+def heif_file(tmp_path):
+    if not features.check("avif"):
+        pytest.skip("Pillow built without AVIF")
+    # AVIF is HEIF with AV1 items; Pillow can write it, unlike HEIC
+    path = tmp_path / "in.avif"
+    _image().save(path, "AVIF", exif=_exif(), xmp=XMP_PACKET)
+    return str(path)
+
+
+def _ffmpeg_clip(folder, name, codec_args, chapters):
+    metadata = os.path.join(folder, "ffmetadata.txt")
+    with open(metadata, "w") as f:
+        f.write(FFMETADATA)
+    path = os.path.join(folder, name)
+    subprocess.run(
+        ["ffmpeg", "-v", "error", "-y",
+         "-f", "lavfi", "-i", "testsrc2=duration=1:size=160x120:rate=10",
+         "-f", "lavfi", "-i", "sine=frequency=440:duration=1",
+         "-i", metadata,
+         "-map", "0:v", "-map", "1:a", "-map_metadata", "2", "-map_chapters", "2" if chapters else "-1",
+         "-metadata:s:v:0", "title=secret video", "-metadata:s:a:0", "title=secret audio",
+         *codec_args, path],
+        check=True,
+    )
+    return path
+
+
+@pytest.fixture
+def video(tmp_path):
+    """Return a factory for small clips with tags (and optionally chapters)."""
+    def make(ext, chapters=False):
+        return _ffmpeg_clip(str(tmp_path), f"in-{chapters}.{ext}",
+                            ["-c:v", "mpeg4", "-c:a", "aac"], chapters)
+    return make
+
+
+@pytest.mark.parametrize("fixture, module, strip", [
+    ("jpeg_file", jpeg, jpeg.strip_jpeg),
+    ("png_file", png, png.strip_png),
+    ("webp_file", webp, webp.strip_webp),
+    ("gif_file", gif, gif.strip_gif),
+    ("tiff_file", tiff, tiff.strip_tiff),
+])
+def test_image_strip_keeps_pixels(request, tmp_path, fixture, module, strip):
+    src = request.getfixturevalue(fixture)
+    dst = str(tmp_path / ("out" + os.path.splitext(src)[1]))
+    assert module.find_metadata(src)
+
+    assert strip(src, dst) > 0
+
+    assert _frames(dst) == _frames(src)
+    assert module.find_metadata(dst) == []
+    assert b"secret" not in _read(dst)
+
+
+def test_heif_strip_keeps_image_data(heif_file):
+    before = heif.data_digest(heif_file)
+    with Image.open(heif_file) as img:
+        pixels = img.tobytes()
+    assert heif.find_metadata(heif_file)
+
+    assert heif.strip_in_place(heif_file) > 0
+
+    assert heif.data_digest(heif_file) == before
+    with Image.open(heif_file) as img:
+        assert img.tobytes() == pixels
+    assert heif.find_metadata(heif_file) == []
+
+
+@needs_ffmpeg
+@pytest.mark.parametrize("ext, module", [
+    ("mp4", isobmff),
+    ("mov", isobmff),
+    ("mkv", ebml),
+])
+def test_video_strip_keeps_streams(video, ext, module):
+    # Matroska chapters are voided in place; MP4/MOV ones need a remux
+    path = video(ext, chapters=module is ebml)
+    original = path + ".orig"
+    shutil.copyfile(path, original)
+    assert module.find_metadata(path)
+
+    assert module.strip_in_place(path) > 0
+
+    assert os.path.getsize(path) == os.path.getsize(original)
+    original_hashes, cleaned_hashes = verify.stream_hashes([original, path])
+    assert [kind for kind, _ in original_hashes] == ["v", "a"]
+    assert cleaned_hashes == original_hashes
+    assert module.find_metadata(path) == []
+    assert b"secret" not in _read(path)
+
+
+@needs_ffmpeg
+@pytest.mark.parametrize("ext", ["mp4", "mov"])
+def test_isobmff_chapters_fall_back_to_remux(video, ext):
+    path = video(ext, chapters=True)
+    original = path + ".orig"
+    shutil.copyfile(path, original)
+    assert "chapter track" in isobmff.find_metadata(path)
+
+    with pytest.raises(UnsupportedStructure):
+        isobmff.strip_in_place(path)
+    assert _read(path) == _read(original)  # Nothing written before raising
+
+    assert clean_file(path)
+    original_hashes, cleaned_hashes = verify.stream_hashes([original, path])
+    assert cleaned_hashes == original_hashes
+    assert isobmff.find_metadata(path) == []
+
+
+@pytest.mark.parametrize("fixture, strip, keep, message", [
+    ("jpeg_file", jpeg.strip_jpeg, -100, "Truncated JPEG"),
+    ("png_file", png.strip_png, -20, "Truncated PNG"),
+    ("webp_file", webp.strip_webp, 40, "Truncated WebP"),  # Inside the image chunk
+    ("gif_file", gif.strip_gif, -10, "Truncated GIF"),
+    ("tiff_file", tiff.strip_tiff, 6, "Truncated TIFF"),
+])
+def test_truncated_image_raises(request, tmp_path, fixture, strip, keep, message):
+    src = request.getfixturevalue(fixture)
+    truncated = str(tmp_path / ("truncated" + os.path.splitext(src)[1]))
+    _truncate(src, truncated, keep)
+
+    with pytest.raises(ValueError, match=message):
+        strip(truncated, str(tmp_path / "out"))
+
+
+@pytest.mark.parametrize("strip, message", [
+    (jpeg.strip_jpeg, "Not a JPEG file"),
+    (png.strip_png, "Not a PNG file"),
+    (webp.strip_webp, "Not a WebP file"),
+    (gif.strip_gif, "Not a GIF file"),
+    (tiff.strip_tiff, "Not a TIFF file"),
+])
+def test_wrong_format_raises(tmp_path, strip, message):
+    src = tmp_path / "garbage"
+    src.write_bytes(b"definitely not an image" * 4)
+
+    with pytest.raises(ValueError, match=message):
+        strip(str(src), str(tmp_path / "out"))
+
+
+def test_png_crc_mismatch_raises(tmp_path, png_file):
+    data = bytearray(_read(png_file))
+    data[data.index(b"IDAT") + 8] ^= 0xFF  # A data byte, so the stored CRC no longer matches
+    corrupt = tmp_path / "corrupt.png"
+    corrupt.write_bytes(bytes(data))
+
+    with pytest.raises(ValueError, match="CRC mismatch"):
+        png.strip_png(str(corrupt), str(tmp_path / "out.png"))
+
+
+def test_tiff_data_outside_file_raises(tmp_path, tiff_file):
+    with Image.open(tiff_file) as img:
+        first_strip = img.tag_v2[273][0]
+    truncated = str(tmp_path / "truncated.tiff")
+    # Keeps the first IFD, but not the strips it points to
+    _truncate(tiff_file, truncated, first_strip + 1)
+
+    with pytest.raises(UnsupportedStructure):
+        tiff.strip_tiff(truncated, str(tmp_path / "out.tiff"))
+
+
+def test_truncated_heif_raises_before_writing(tmp_path, heif_file):
+    truncated = str(tmp_path / "truncated.avif")
+    _truncate(heif_file, truncated, 200)
+    before = _read(truncated)
+
+    with pytest.raises(UnsupportedStructure):
+        heif.strip_in_place(truncated)
+    assert _read(truncated) == before
+
+
+@needs_ffmpeg
+@pytest.mark.parametrize("ext, module", [
+    ("mp4", isobmff),
+    ("mkv", ebml),
+])
+def test_truncated_video_raises_before_writing(video, ext, module):
+    path = video(ext)
+    _truncate(path, path, os.path.getsize(path) // 2)
+    before = _read(path)
+
+    with pytest.raises(UnsupportedStructure):
+        module.strip_in_place(path)
+    assert _read(path) == before
+
+
+@pytest.mark.parametrize("module", [isobmff, ebml, heif])
+def test_in_place_wrong_format_raises(tmp_path, module):
+    path = tmp_path / "garbage"
+    path.write_bytes(b"\xff" * 64)
+
+    with pytest.raises(UnsupportedStructure):
+        module.strip_in_place(str(path))
+    assert path.read_bytes() == b"\xff" * 64